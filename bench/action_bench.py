@@ -0,0 +1,383 @@
+"""
+End-to-end latency benchmark for the actions against a local API stand-in.
+
+Runs `Action.action` of the ComfyUI Workflow Loader, Quick Image Config and
+Quick Voice Config against an aiohttp stub of the Open WebUI API and ComfyUI.
+Fake `__event_call__`/`__event_emitter__` callables stand in for the UI and
+time each phase: `modal` is the time until the input modal opens, `apply` the
+time from the user's reply to the final status. Every invocation is counted
+per route, together with the TCP connections the stub accepted, so connection
+reuse, caching and concurrency changes show up directly.
+
+The loader also runs once per entry of LOADER_SCENARIOS with the optional
+stages it names switched on; a scenario whose stage never reached the stub
+(e.g. no `/prompt` with `warmup_after_load`) is reported and fails the run.
+
+Pass `--baseline <git rev>` to run the actions from another revision against
+the same stub, e.g. `--baseline HEAD~5`.
+
+Usage:
+    python bench/action_bench.py [--runs 50] [--concurrency 1 8] [--latency-ms 20]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ACTIONS: Dict[str, str] = {
+    "loader": "functions/actions/comfy-workflow-loader/comfy_workflow_loader.py",
+    "image": "functions/actions/quick-image-conf/quick_image_conf.py",
+    "voice": "functions/actions/quick-voice-conf/quick_voice_conf.py",
+}
+KB_ID = "bench-kb"
+
+# Alternating replies, so every other invocation actually changes something.
+REPLIES: Dict[str, List[str]] = {
+    "loader": ["workflow-0", "workflow-1"],
+    "image": ["st:20 dm:512x768", "st:30 dm:768x512"],
+    "voice": ["vc:am_adam sp:1.2", "vc:bm_lewis sp:1.0"],
+}
+
+# Loader valves per scenario, and the routes the scenario has to reach on the stub.
+LOADER_SCENARIOS: Dict[str, Tuple[Dict[str, Any], List[str]]] = {
+    "default": ({}, []),
+    "warmup": ({"warmup_after_load": True}, ["POST /prompt", "GET /history/{id}"]),
+    # The two workflows use different models, so every other load evicts.
+    "evict": ({"evict_on_model_change": True}, ["POST /free"]),
+    # The stub's device has 18 GB free, below this threshold.
+    "unload-vram": ({"telemetry_interval": 0.02, "auto_unload_free_vram_gb": 20.0}, ["POST /free"]),
+    # The stub never reports work, so it counts as idle after 6ms.
+    "unload-idle": ({"telemetry_interval": 0.02, "auto_unload_idle_minutes": 0.0001}, ["POST /free"]),
+}
+
+IMAGE_MODELS: List[str] = ["flux1-dev.safetensors", "flux1-schnell.safetensors", "sdxl_base.safetensors"]
+VOICES: List[str] = ["am_adam", "bm_lewis", "af_bella"]
+
+TITLED_NODES: Dict[str, Dict[str, Any]] = {
+    "model": {"class_type": "UNETLoader", "inputs": {"unet_name": "flux1-dev.safetensors"}},
+    "positive_prompt": {"class_type": "CLIPTextEncode", "inputs": {"text": "a lighthouse", "clip": ["1", 0]}},
+    "dimensions": {"class_type": "EmptySD3LatentImage", "inputs": {"width": 1024, "height": 768, "batch_size": 1}},
+    "seed": {"class_type": "RandomNoise", "inputs": {"noise_seed": 42}},
+    "scheduler": {"class_type": "BasicScheduler", "inputs": {"scheduler": "simple", "steps": 20, "denoise": 1.0}},
+}
+
+
+def make_workflow(index: int, filler_nodes: int) -> str:
+    """Returns the JSON of a workflow with the titled nodes and `filler_nodes` others."""
+    nodes: Dict[str, Any] = {}
+    for i in range(filler_nodes):
+        nodes[str(i + 1)] = {
+            "class_type": "LoraLoader",
+            "inputs": {"lora_name": f"lora_{i}.safetensors", "strength_model": 0.8},
+            "_meta": {"title": f"Load LoRA {i}"},
+        }
+    for title, body in TITLED_NODES.items():
+        node = json.loads(json.dumps(body))
+        if title == "model":
+            node["inputs"]["unet_name"] = f"model-{index}.safetensors"
+        nodes[str(len(nodes) + 1)] = dict(node, _meta={"title": title})
+    return json.dumps(nodes, indent=2)
+
+
+class StubServer:
+    """
+    aiohttp stand-in for the Open WebUI API and ComfyUI.
+
+    Every request is delayed by `latency` seconds and counted per route; the
+    peer address of each request is kept to count the connections opened.
+    """
+
+    def __init__(self, latency: float, workflows: int, workflow_nodes: int, settings_kb: int) -> None:
+        self.latency = latency
+        self.counts: Counter = Counter()
+        self.peers: set = set()
+        self.files = {
+            f"file-{i}": {"id": f"file-{i}", "hash": f"h{i}", "data": {"content": make_workflow(i, workflow_nodes)}}
+            for i in range(workflows)
+        }
+        self.knowledge = {
+            "id": KB_ID,
+            "updated_at": 1,
+            "files": [
+                {"id": file_id, "hash": f"h{i}", "meta": {"name": f"workflow-{i}.json"}}
+                for i, file_id in enumerate(self.files)
+            ],
+        }
+        self.images_config: Dict[str, Any] = {
+            "enabled": True,
+            "engine": "comfyui",
+            "comfyui": {"COMFYUI_BASE_URL": "http://comfyui:8188", "COMFYUI_WORKFLOW": "", "COMFYUI_WORKFLOW_NODES": []},
+        }
+        self.image_config: Dict[str, Any] = {"MODEL": "", "IMAGE_SIZE": "512x512", "IMAGE_STEPS": 20}
+        self.settings: Dict[str, Any] = {
+            "ui": {"audio": {"tts": {"voice": "af_bella"}}, "padding": "x" * (settings_kb * 1024)}
+        }
+        self.stats = {
+            "system": {"ram_total": 64 * 2**30, "ram_free": 32 * 2**30},
+            "devices": [{"name": "cuda:0", "vram_total": 24 * 2**30, "vram_free": 18 * 2**30}],
+        }
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler: Callable) -> web.StreamResponse:
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.counts[f"{request.method} {route}"] += 1
+        self.peers.add(request.transport.get_extra_info("peername") if request.transport else None)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def start(self) -> str:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/api/v1/knowledge/{id}", lambda r: web.json_response(self.knowledge))
+        app.router.add_get("/api/v1/files/{id}", lambda r: web.json_response(self.files[r.match_info["id"]]))
+        app.router.add_get("/api/v1/images/config", lambda r: web.json_response(self.images_config))
+        app.router.add_post("/api/v1/images/config/update", self.post_images_config)
+        app.router.add_get("/api/v1/images/image/config", lambda r: web.json_response(self.image_config))
+        app.router.add_post("/api/v1/images/image/config/update", self.post_image_config)
+        app.router.add_get("/api/v1/images/models", lambda r: web.json_response([{"id": m, "name": m} for m in IMAGE_MODELS]))
+        app.router.add_get("/api/v1/audio/voices", lambda r: web.json_response({"voices": [{"id": v, "name": v} for v in VOICES]}))
+        app.router.add_get("/api/v1/users/user/settings", lambda r: web.json_response(self.settings))
+        app.router.add_post("/api/v1/users/user/settings/update", self.post_settings)
+        app.router.add_get("/system_stats", lambda r: web.json_response(self.stats))
+        app.router.add_get("/queue", lambda r: web.json_response({"queue_running": [], "queue_pending": []}))
+        app.router.add_post("/free", lambda r: web.json_response({}))
+        app.router.add_post("/prompt", lambda r: web.json_response({"prompt_id": "bench", "number": 1}))
+        app.router.add_get("/history/{id}", lambda r: web.json_response({r.match_info["id"]: {"status": {"completed": True}}}))
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self.runner:
+            await self.runner.cleanup()
+
+    def reset_counts(self) -> None:
+        self.counts.clear()
+        self.peers.clear()
+
+    async def post_images_config(self, request: web.Request) -> web.Response:
+        self.images_config = await request.json()
+        return web.json_response(self.images_config)
+
+    async def post_image_config(self, request: web.Request) -> web.Response:
+        self.image_config = await request.json()
+        return web.json_response(self.image_config)
+
+    async def post_settings(self, request: web.Request) -> web.Response:
+        # Open WebUI merges posted settings into the stored ones at the top level.
+        self.settings = {**self.settings, **await request.json()}
+        return web.json_response(self.settings)
+
+
+class FakeUI:
+    """`__event_call__` and `__event_emitter__` stand-ins that time the phases of one invocation."""
+
+    def __init__(self, reply: str) -> None:
+        self.reply = reply
+        self.started = time.perf_counter()
+        self.modal_at: Optional[float] = None
+        self.replied_at: Optional[float] = None
+        self.done_at: Optional[float] = None
+        self.statuses: List[str] = []
+
+    async def event_call(self, event: dict) -> str:
+        self.modal_at = time.perf_counter()
+        self.replied_at = time.perf_counter()
+        return self.reply
+
+    async def event_emitter(self, event: dict) -> None:
+        data = event.get("data", {})
+        self.statuses.append(str(data.get("description", "")))
+        if data.get("done"):
+            self.done_at = time.perf_counter()
+
+
+def load_module(path: Path, name: str):
+    """Imports the action module at `path` under `name`."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_revision(rev: str, workdir: Path, kind: str, scenario: str = "default"):
+    """Writes an action from git revision `rev` to `workdir` and imports it."""
+    source = subprocess.run(
+        ["git", "-C", str(REPO_ROOT), "show", f"{rev}:{ACTIONS[kind]}"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    path = workdir / f"{kind}_{rev.replace('/', '_').replace('~', '_')}.py"
+    path.write_text(source)
+    return load_module(path, f"bench_{kind}_{abs(hash((rev, kind, scenario)))}")
+
+
+def make_action(module, kind: str, url: str, extra_valves: Optional[Dict[str, Any]] = None):
+    """Creates an Action pointed at the stub, leaving valves the revision does not have alone."""
+    action = module.Action()
+    valves = {"api_base_url": url, "knowledge_base_id": KB_ID, "comfyui_url": url, "show_vram": True}
+    for name, value in {**valves, **(extra_valves or {})}.items():
+        if hasattr(action.valves, name):
+            setattr(action.valves, name, value)
+    return action
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+async def run_scenario(
+    module, kind: str, stub: StubServer, runs: int, concurrency: int, valves: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Invokes one action `runs` times, `concurrency` at a time, and summarises the timings."""
+    stub.reset_counts()
+    totals: List[float] = []
+    modals: List[float] = []
+    applies: List[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def invoke(index: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            ui = FakeUI(REPLIES[kind][index % len(REPLIES[kind])])
+            action = make_action(module, kind, stub.url, valves)
+            try:
+                await action.action(
+                    {"messages": []},
+                    __user__={"id": "bench"},
+                    __event_emitter__=ui.event_emitter,
+                    __event_call__=ui.event_call,
+                )
+            except Exception as e:
+                ui.statuses.append(f"error: {e!r}")
+            finished = time.perf_counter()
+            totals.append(finished - ui.started)
+            if ui.modal_at is not None:
+                modals.append(ui.modal_at - ui.started)
+                applies.append((ui.done_at or finished) - ui.replied_at)
+            if not ui.statuses or "rror" in ui.statuses[-1] or "problem" in ui.statuses[-1]:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(invoke(i) for i in range(runs)))
+    wall = time.perf_counter() - started
+    return {
+        "total": totals,
+        "modal": modals,
+        "apply": applies,
+        "wall": wall,
+        "requests": sum(stub.counts.values()),
+        "routes": dict(stub.counts),
+        "connections": len(stub.peers),
+        "failures": failures,
+    }
+
+
+async def close_sessions(modules: List[Any]) -> None:
+    """Closes pooled sessions and stops background tasks the actions left behind."""
+    for module in modules:
+        telemetry = getattr(module, "_TELEMETRY", None)
+        if hasattr(telemetry, "stop"):
+            telemetry.stop()
+        elif getattr(telemetry, "task", None) is not None:
+            telemetry.task.cancel()  # Revisions from before TelemetryPoller.stop.
+        close = getattr(module, "close_http_session", None)
+        if close is not None:
+            await close()
+
+
+def format_ms(values: List[float]) -> str:
+    if not values:
+        return f"{'-':>17}"
+    return f"{percentile(values, 0.5) * 1000:>7.1f}/{percentile(values, 0.99) * 1000:>7.1f}ms"
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    stub = StubServer(args.latency_ms / 1000, args.workflows, args.workflow_nodes, args.settings_kb)
+    await stub.start()
+    revisions = ["current"] + ([args.baseline] if args.baseline else [])
+    loaded: List[Any] = []
+    missed = False
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(
+                f"{'action':<18} {'rev':<10} {'conc':>4} {'runs':>5} {'total p50/p99':>17} {'modal p50/p99':>17} "
+                f"{'apply p50/p99':>17} {'req/run':>8} {'conns':>6} {'fail':>5}"
+            )
+            for kind in args.actions:
+                scenarios = args.scenarios if kind == "loader" else ["default"]
+                for scenario in scenarios:
+                    valves, expected_routes = LOADER_SCENARIOS[scenario]
+                    label = kind if scenario == "default" else f"{kind}:{scenario}"
+                    for rev in revisions:
+                        # A fresh module per scenario, so caches and telemetry start empty.
+                        if rev == "current":
+                            module = load_module(REPO_ROOT / ACTIONS[kind], f"bench_{kind}_current_{scenario}")
+                        else:
+                            module = load_revision(rev, Path(workdir), kind, scenario)
+                        loaded.append(module)
+                        reached: Counter = Counter()
+                        for concurrency in args.concurrency:
+                            result = await run_scenario(module, kind, stub, args.runs, concurrency, valves)
+                            print(
+                                f"{label:<18} {rev[:10]:<10} {concurrency:>4} {args.runs:>5} {format_ms(result['total'])} "
+                                f"{format_ms(result['modal'])} {format_ms(result['apply'])} "
+                                f"{result['requests'] / args.runs:>8.2f} {result['connections']:>6} {result['failures']:>5}"
+                            )
+                            if args.routes:
+                                for route, count in sorted(result["routes"].items()):
+                                    print(f"{'':<19}{route:<48} {count / args.runs:>6.2f}/run")
+                            reached.update(result["routes"])
+                        # Automatic unloads happen once per idle period, not necessarily at every level.
+                        missing = [route for route in expected_routes if not reached[route]]
+                        if missing:
+                            missed = True
+                            print(f"{'':<19}not reached: {', '.join(missing)}")
+                        await close_sessions([module])
+    finally:
+        await close_sessions(loaded)
+        await stub.stop()
+    return 1 if missed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--actions", nargs="+", choices=list(ACTIONS), default=list(ACTIONS))
+    parser.add_argument("--runs", type=int, default=50, help="Invocations per action and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(LOADER_SCENARIOS), default=list(LOADER_SCENARIOS),
+        help="Loader valve scenarios to run",
+    )
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Delay added to every stub response")
+    parser.add_argument("--workflows", type=int, default=20, help="Workflows in the knowledge base")
+    parser.add_argument("--workflow-nodes", type=int, default=200, help="Filler nodes per workflow")
+    parser.add_argument("--settings-kb", type=int, default=16, help="Size of the user settings document")
+    parser.add_argument("--baseline", help="Git revision to compare against")
+    parser.add_argument("--routes", action="store_true", help="Print requests per route")
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Benchmarks and fuzzes the command parsers of the quick-config actions.
+
+Times `Action.parse_input` of Quick Image Config and Quick Voice Config over a
+corpus of hand-written edge cases plus generated command strings, then checks
+three properties on a seeded random corpus:
+
+- agreement: every input the baseline parser accepts parses to the same
+  updates (needs `--baseline`; quoted values are only generated, and only
+  compared, where the baseline supported quoting, i.e. `md:`)
+- robustness: arbitrary strings of quotes, backslashes, colons and spaces
+  only ever raise ValueError
+- escapes: any string, quoted and escaped, round-trips through `md:`/`vc:`
+
+Pass `--baseline <git rev>` to compare against the parsers of another
+revision, e.g. `--baseline HEAD~1`. Exits with 1 if a property fails.
+
+Usage:
+    python bench/grammar_bench.py [--baseline REV] [--cases 5000] [--seed 0]
+"""
+
+import argparse
+import importlib.util
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ACTIONS: Dict[str, str] = {
+    "image": "functions/actions/quick-image-conf/quick_image_conf.py",
+    "voice": "functions/actions/quick-voice-conf/quick_voice_conf.py",
+}
+
+# Hand-written inputs, valid and not, that every parser revision must survive.
+EDGE_CASES: Dict[str, List[str]] = {
+    "image": [
+        "st:16",
+        "ST:16 DM:768x1344",
+        'st:20 dm:768x1344 md:"SDXL 1.0"',
+        "dm:tg",
+        "dm:TG st:4",
+        'md:"flux1-dev.safetensors"',
+        'md:""',
+        "md:unquoted",
+        'md:"unterminated',
+        "st:0",
+        "st:-3",
+        "st:abc",
+        "dm:0x512",
+        "dm:5x5x5",
+        "dm:768",
+        "p:portrait-hq",
+        "p:",
+        "hello",
+        "",
+        "   ",
+    ],
+    "voice": [
+        "vc:am_adam",
+        "vc:bm_lewis(2)+am_adam(1)",
+        "sp:1.5",
+        "SP:0.5 AP:tg",
+        "vc:af_bella sp:2 ap:tg",
+        "vc:",
+        'vc:""',
+        "sp:3",
+        "sp:nan",
+        "sp:fast",
+        "ap:on",
+        "hello",
+        "",
+    ],
+}
+
+# Commands whose values the parsers before the shared grammar already unquoted.
+# Inputs quoting any other command are left out of the agreement check.
+BASELINE_QUOTED: Dict[str, Tuple[str, ...]] = {"image": ("md",), "voice": ()}
+_QUOTED_COMMAND_RE = re.compile(r'(\w+):"')
+
+Parser = Callable[[str], Dict[str, Any]]
+
+
+def load_parser(source: Path) -> Tuple[Parser, Any]:
+    """Imports the action module at `source`; returns its parse_input and the module."""
+    spec = importlib.util.spec_from_file_location(f"action_{abs(hash(source))}", source)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Action().parse_input, module
+
+
+def load_baseline(rev: str, path: str, workdir: Path) -> Tuple[Parser, Any]:
+    """Writes the action from git revision `rev` to `workdir` and imports its parser."""
+    source = subprocess.run(
+        ["git", "-C", str(REPO_ROOT), "show", f"{rev}:{path}"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    target = workdir / f"baseline_{Path(path).name}"
+    target.write_text(source)
+    return load_parser(target)
+
+
+def outcome(parse: Parser, text: str) -> Tuple[str, Any]:
+    """Returns ("ok", updates) or ("error", message); anything but ValueError is ("crash", ...)."""
+    try:
+        return "ok", parse(text)
+    except ValueError as e:
+        return "error", str(e)
+    except Exception as e:
+        return "crash", repr(e)
+
+
+def random_value(rng: random.Random) -> str:
+    """A plausible or broken command value, without quotes or backslashes."""
+    return rng.choice(
+        [
+            str(rng.randint(-5, 200)),
+            f"{rng.uniform(0, 3):.2f}",
+            f"{rng.randint(0, 2048)}x{rng.randint(0, 2048)}",
+            "tg",
+            "TG",
+            "",
+            rng.choice(["am_adam", "bm_lewis(2)+am_adam(1)", "flux1-dev", "nan", "1e3", "x"]),
+        ]
+    )
+
+
+def generate_command(rng: random.Random, action: str) -> str:
+    """One command from the action's grammar, or a stray token."""
+    keys = {"image": ["st", "dm", "md", "p"], "voice": ["vc", "sp", "ap"]}[action]
+    key = rng.choice(keys + ["zz"])
+    if rng.random() < 0.5:
+        key = key.upper()
+    if action == "image" and key.lower() == "md" and rng.random() < 0.8:
+        words = [rng.choice(["SDXL", "1.0", "flux", "dev", "base"]) for _ in range(rng.randint(0, 3))]
+        return f'{key}:"{" ".join(words)}"'
+    return f"{key}:{random_value(rng)}" if rng.random() < 0.95 else random_value(rng)
+
+
+def generate_input(rng: random.Random, action: str) -> str:
+    """A space separated run of generated commands."""
+    return " ".join(generate_command(rng, action) for _ in range(rng.randint(0, 4)))
+
+
+def random_noise(rng: random.Random) -> str:
+    """An arbitrary string, heavy on the characters the tokenizer cares about."""
+    alphabet = 'ab:x" \\\t1é'
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+
+
+def escape(value: str) -> str:
+    """Quotes a value for the command grammar."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def time_corpus(parse: Parser, module: Any, corpus: List[str], repeat: int) -> float:
+    """Returns the best time to parse the whole corpus, in microseconds per input, with caches cleared."""
+    best = float("inf")
+    for _ in range(repeat):
+        if hasattr(module, "tokenize"):
+            module.tokenize.cache_clear()
+        start = time.perf_counter()
+        for text in corpus:
+            outcome(parse, text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+
+def check_properties(
+    action: str, parse: Parser, baseline: Any, rng: random.Random, cases: int
+) -> List[str]:
+    """Runs the fuzz properties and returns a description of each counterexample."""
+    failures: List[str] = []
+    generated = EDGE_CASES[action] + [generate_input(rng, action) for _ in range(cases)]
+    if baseline is not None:
+        for text in generated:
+            if any(key.lower() not in BASELINE_QUOTED[action] for key in _QUOTED_COMMAND_RE.findall(text)):
+                continue
+            before, after = outcome(baseline, text), outcome(parse, text)
+            if before[0] == "ok" and after != before:
+                failures.append(f"agreement: {text!r}: {before} -> {after}")
+    for _ in range(cases):
+        text = random_noise(rng)
+        result = outcome(parse, text)
+        if result[0] == "crash":
+            failures.append(f"robustness: {text!r}: {result[1]}")
+    key, field = {"image": ("md", "model"), "voice": ("vc", "voice")}[action]
+    for _ in range(cases // 10):
+        value = random_noise(rng)
+        result = outcome(parse, f"{key}:{escape(value)}")
+        if result != ("ok", {field: value}):
+            failures.append(f"escapes: {value!r}: {result}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", help="Git revision to compare against")
+    parser.add_argument("--cases", type=int, default=5000, help="Generated inputs per property")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'action':<7} {'parser':>12} {'µs/input':>10}")
+        for action, path in ACTIONS.items():
+            rng = random.Random(args.seed)
+            corpus = EDGE_CASES[action] + [generate_input(rng, action) for _ in range(1000)]
+            parsers = {"current": load_parser(REPO_ROOT / path)}
+            if args.baseline:
+                parsers[args.baseline] = load_baseline(args.baseline, path, Path(workdir))
+            for name, (parse, module) in parsers.items():
+                print(f"{action:<7} {name:>12} {time_corpus(parse, module, corpus, args.repeat):>10.2f}")
+
+            baseline = parsers[args.baseline][0] if args.baseline else None
+            failures = check_properties(action, parsers["current"][0], baseline, rng, args.cases)
+            for failure in failures[:10]:
+                print(f"  {action}: {failure}")
+            if failures:
+                print(f"  {action}: {len(failures)} counterexamples")
+            failed = failed or bool(failures)
+    print("properties: " + ("FAILED" if failed else "ok"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
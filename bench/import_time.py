@@ -0,0 +1,109 @@
+"""
+Measures how long each tool and function module takes to import.
+
+Open WebUI loads every installed function and tool at startup and again on
+each reload, so anything done at module level is paid for every time. Each
+module is imported in a fresh interpreter (the same way a cold server start
+would see it) and the script reports the wall time of the import together
+with any heavy third-party packages that ended up in `sys.modules`.
+
+Usage:
+    python bench/import_time.py [--runs N] [path ...]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Packages that should only be imported on first use, never at module load.
+HEAVY_MODULES: List[str] = ["aiohttp", "caldav", "icalendar", "pytz", "dotenv"]
+
+# Runs inside the child interpreter. Baseline modules (pydantic, typing, ...)
+# and asyncio, which Open WebUI always has loaded, are imported first so the
+# timing only covers the module under test.
+CHILD_SCRIPT = """
+import importlib.util, json, sys, time
+import asyncio, pydantic, typing, logging, json as _json
+class _Warm(pydantic.BaseModel):  # Open WebUI has built pydantic models long before.
+    value: int = 0
+path, heavy = sys.argv[1], sys.argv[2].split(",")
+before = set(sys.modules)
+spec = importlib.util.spec_from_file_location("module_under_test", path)
+module = importlib.util.module_from_spec(spec)
+start = time.perf_counter()
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - start
+loaded = sorted(m for m in set(sys.modules) - before if m.split(".")[0] in heavy)
+print(json.dumps({"seconds": elapsed, "heavy": sorted({m.split(".")[0] for m in loaded})}))
+"""
+
+
+def discover_modules() -> List[Path]:
+    """Returns every tool and function module in the repository."""
+    return sorted(
+        path
+        for folder in ("functions", "tools")
+        for path in (REPO_ROOT / folder).rglob("*.py")
+    )
+
+
+def display_name(path: Path) -> str:
+    """Returns `path` relative to the repository, or absolute for a checkout elsewhere."""
+    try:
+        return str(path.relative_to(REPO_ROOT))
+    except ValueError:
+        return str(path)
+
+
+def measure(path: Path, runs: int) -> Dict[str, object]:
+    """Imports `path` in `runs` fresh interpreters and summarises the timings."""
+    timings: List[float] = []
+    heavy: List[str] = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT, str(path), ",".join(HEAVY_MODULES)],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        sample = json.loads(result.stdout)
+        timings.append(sample["seconds"])
+        heavy = sample["heavy"]
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+        "heavy": heavy,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", type=Path, help="Modules to measure (default: all)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    args = parser.parse_args()
+
+    paths = [p.resolve() for p in args.paths] or discover_modules()
+    failed = False
+    print(f"{'module':<66} {'median':>9} {'max':>9}  heavy imports")
+    for path in paths:
+        name = display_name(path)
+        stats = measure(path, args.runs)
+        if "error" in stats:
+            print(f"{name:<66} {'error':>9} {'':>9}  {stats['error']}")
+            failed = True
+            continue
+        heavy = ", ".join(stats["heavy"]) or "-"
+        print(f"{name:<66} {stats['median_ms']:>7.2f}ms {stats['max_ms']:>7.2f}ms  {heavy}")
+        failed = failed or bool(stats["heavy"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
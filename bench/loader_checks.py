@@ -0,0 +1,228 @@
+"""
+Behaviour checks for the ComfyUI Workflow Loader against the action bench stub.
+
+Each check runs `Action.action` (or one of its helpers) of the current loader
+against stub servers from bench/action_bench.py and compares what Open WebUI
+ends up configured with to what the check expects:
+
+- routing: loads routed to a secondary ComfyUI server and then back to a
+  primary `comfyui_url` without `|owui_url` restore Open WebUI's original
+  ComfyUI Base URL
+- names: `WorkflowNameIndex.match` keeps workflow names that only differ in
+  case apart and picks the one typed with its exact case
+- validation: workflows downloaded by the background validation are reused
+  by the selection that follows, and only fill free workflow cache slots
+- unload: `Action.unload_policy` asks for `/free` on low VRAM (keeping the
+  cache) and after the idle time (freeing it), and leaves busy, unsampled or
+  already unloaded servers alone
+
+Exits with 1 if a check fails.
+
+Usage:
+    python bench/loader_checks.py [--checks routing names validation unload ...]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from action_bench import ACTIONS, REPO_ROOT, FakeUI, StubServer, close_sessions, load_module, make_action  # noqa: E402
+
+ORIGINAL_BASE_URL = "http://host.docker.internal:8188"
+SECONDARY_BASE_URL = "http://gpu2:8188"
+
+
+def set_free_vram(stub: StubServer, gb: float) -> None:
+    """Makes the stub's ComfyUI report `gb` of free VRAM on its only device."""
+    stub.stats["devices"][0]["vram_free"] = int(gb * 2**30)
+
+
+class TypingUI(FakeUI):
+    """A FakeUI that takes `delay` seconds to answer the modal, like a user typing."""
+
+    def __init__(self, reply: str, delay: float) -> None:
+        super().__init__(reply)
+        self.delay = delay
+
+    async def event_call(self, event: dict) -> str:
+        await asyncio.sleep(self.delay)
+        return await super().event_call(event)
+
+
+async def run_action(
+    module: Any, stub: StubServer, reply: str, typing_delay: float = 0.0, **valves: Any
+) -> FakeUI:
+    """Runs the loader once against `stub` with `valves` on top of the bench defaults."""
+    ui = TypingUI(reply, typing_delay)
+    action = make_action(module, "loader", stub.url)
+    for name, value in valves.items():
+        setattr(action.valves, name, value)
+    await action.action(
+        {"messages": []},
+        __user__={"id": "checks"},
+        __event_emitter__=ui.event_emitter,
+        __event_call__=ui.event_call,
+    )
+    return ui
+
+
+async def check_routing(module: Any) -> List[str]:
+    """Secondary, then primary: Open WebUI must go back to the address it had before routing."""
+    failures: List[str] = []
+    primary, secondary = StubServer(0, 3, 20, 1), StubServer(0, 1, 20, 1)
+    await primary.start()
+    await secondary.start()
+    try:
+        primary.images_config["comfyui"]["COMFYUI_BASE_URL"] = ORIGINAL_BASE_URL
+        valves = {
+            "show_vram": False,
+            "comfyui_url": primary.url,
+            "comfyui_backends": f"{secondary.url}|{SECONDARY_BASE_URL}",
+        }
+        steps = [
+            ("workflow-0", 22, SECONDARY_BASE_URL),  # The secondary has more free VRAM.
+            ("workflow-1", 2, ORIGINAL_BASE_URL),  # Now the primary has.
+            ("workflow-1", 2, ORIGINAL_BASE_URL),  # Re-selected on the primary.
+            ("workflow-2", 22, SECONDARY_BASE_URL),
+            ("workflow-0", 2, ORIGINAL_BASE_URL),
+        ]
+        for reply, secondary_free_gb, expected in steps:
+            set_free_vram(secondary, secondary_free_gb)
+            ui = await run_action(module, primary, reply, **valves)
+            stored = primary.images_config["comfyui"]["COMFYUI_BASE_URL"]
+            if stored != expected or "loaded" not in ui.statuses[-1]:
+                failures.append(f"routing: {reply} -> {ui.statuses[-1]!r}, COMFYUI_BASE_URL {stored} (expected {expected})")
+    finally:
+        await close_sessions([module])
+        await primary.stop()
+        await secondary.stop()
+    return failures
+
+
+async def check_names(module: Any) -> List[str]:
+    """Names that collide when lower-cased must all stay reachable."""
+    failures: List[str] = []
+    index = module.WorkflowNameIndex(["Flux-Dev", "flux-dev", "FLUX-dev-fp8", "sdxl-base"])
+    cases = [
+        ("Flux-Dev", ["Flux-Dev"]),
+        ("flux-dev", ["flux-dev"]),
+        ("FLUX-DEV", ["Flux-Dev", "flux-dev"]),  # No exact-case match: both are candidates.
+        ("flux-dev-fp8", ["FLUX-dev-fp8"]),
+        ("flux", ["Flux-Dev", "flux-dev", "FLUX-dev-fp8"]),
+        ("sdxl", ["sdxl-base"]),
+    ]
+    for query, expected in cases:
+        matches = index.match(query)
+        if matches != expected:
+            failures.append(f"names: {query!r} -> {matches} (expected {expected})")
+    return failures
+
+
+async def check_validation(module: Any) -> List[str]:
+    """Validation fills the workflow cache for the selection, without disturbing used entries."""
+    failures: List[str] = []
+    stub = StubServer(0, 2, 20, 1)
+    await stub.start()
+    try:
+        # The reply comes after the validation of both workflows has finished.
+        ui = await run_action(module, stub, "workflow-1", typing_delay=0.2, show_vram=False)
+        downloads = stub.counts["GET /api/v1/files/{id}"]
+        if downloads != 2 or "loaded" not in ui.statuses[-1]:
+            failures.append(f"validation: {downloads} file downloads for 2 workflows -> {ui.statuses[-1]!r}")
+    finally:
+        await close_sessions([module])
+        await stub.stop()
+
+    def entry(name: str) -> Any:
+        return module.CachedWorkflow({"id": name}, name, {}, [])
+
+    cache = module.WorkflowCache(3)
+    cache.put("used-a", entry("used-a"))
+    cache.put("used-b", entry("used-b"))
+    validated = entry("used-a")
+    cache.offer("used-a", validated)
+    cache.offer("fresh", entry("fresh"))
+    cache.offer("extra", entry("extra"))
+    if list(cache.entries) != ["fresh", "used-a", "used-b"] or cache.entries["used-a"] is validated:
+        failures.append(f"validation: offer left the cache as {list(cache.entries)}")
+    return failures
+
+
+async def check_unload(module: Any) -> List[str]:
+    """unload_policy against hand-built telemetry: None, or the `free_memory` flag for /free."""
+    failures: List[str] = []
+    action = module.Action()
+    action.valves.auto_unload_free_vram_gb = 4.0
+    action.valves.auto_unload_idle_minutes = 10.0
+    now = time.monotonic()
+
+    def case(free_gb: float, queue_depth: Any = 0, idle_minutes: float = 0.0, unloaded: bool = False) -> Any:
+        backend = module.ComfyBackend("http://comfyui:8188")
+        backend.stats = {"devices": [{"name": "cuda:0", "vram_total": 24 * 2**30, "vram_free": int(free_gb * 2**30)}]}
+        backend.queue_depth = queue_depth
+        telemetry = module.BackendTelemetry(8)
+        telemetry.last_busy = now - idle_minutes * 60
+        if unloaded:
+            telemetry.auto_unloaded_at = now
+        return backend, telemetry
+
+    cases = [
+        ("plenty of VRAM, just busy", case(18), None),
+        ("low VRAM", case(2), False),
+        ("idle for 11 minutes", case(18, idle_minutes=11), True),
+        ("idle and low VRAM", case(2, idle_minutes=11), True),
+        ("low VRAM, queue running", case(2, queue_depth=1), None),
+        ("low VRAM, queue unknown", case(2, queue_depth=None), None),
+        ("low VRAM, unloaded since last busy", case(2, unloaded=True), None),
+        ("idle, unloaded since last busy", case(18, idle_minutes=11, unloaded=True), None),
+    ]
+    for name, (backend, telemetry), expected in cases:
+        decision = action.unload_policy(backend, telemetry)
+        if decision is not expected:
+            failures.append(f"unload: {name} -> {decision} (expected {expected})")
+    backend, _ = case(2)
+    if action.unload_policy(backend, None) is not None:
+        failures.append("unload: unsampled server was unloaded")
+    action.valves.auto_unload_free_vram_gb = 0.0
+    action.valves.auto_unload_idle_minutes = 0.0
+    backend, telemetry = case(2, idle_minutes=11)
+    if action.unload_policy(backend, telemetry) is not None:
+        failures.append("unload: unloaded with both thresholds disabled")
+    return failures
+
+
+CHECKS: Dict[str, Callable[[Any], Awaitable[List[str]]]] = {
+    "routing": check_routing,
+    "names": check_names,
+    "validation": check_validation,
+    "unload": check_unload,
+}
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    failed = False
+    for name in args.checks:
+        # A fresh copy of the loader per check, so module-level caches start empty.
+        module = load_module(REPO_ROOT / ACTIONS["loader"], f"checks_loader_{name}")
+        failures = await CHECKS[name](module)
+        print(f"{name:<12} {'FAILED' if failures else 'ok'}")
+        for failure in failures:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checks", nargs="+", choices=list(CHECKS), default=list(CHECKS))
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Benchmarks WorkflowParser from the ComfyUI Workflow Loader on large workflows.
+
+Generates synthetic API-format workflows with thousands of filler nodes and
+the five titled nodes the loader needs, then times `WorkflowParser.parse` on
+both the raw file document (including the nested `data.content` JSON) and on
+already-decoded nodes (the graph walk alone). Peak memory (tracemalloc) of
+the document parse is reported too; `--preview-kb` embeds base64-sized
+strings in some filler nodes, like workflows that carry image previews.
+
+Pass `--baseline <git rev>` to time the parser from another revision side by
+side, e.g. `--baseline HEAD~1`.
+
+Usage:
+    python bench/parser_bench.py [--nodes 1000 5000 20000] [--baseline REV]
+"""
+
+import argparse
+import importlib.util
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LOADER_PATH = "functions/actions/comfy-workflow-loader/comfy_workflow_loader.py"
+
+TITLED_NODES: Dict[str, Dict[str, Any]] = {
+    "model": {"class_type": "UNETLoader", "inputs": {"unet_name": "flux1-dev.safetensors", "weight_dtype": "default"}},
+    "positive_prompt": {"class_type": "CLIPTextEncode", "inputs": {"text": "a lighthouse at dusk", "clip": ["11", 0]}},
+    "dimensions": {"class_type": "EmptySD3LatentImage", "inputs": {"width": 1024, "height": 768, "batch_size": 1}},
+    "seed": {"class_type": "RandomNoise", "inputs": {"noise_seed": 123456789}},
+    "scheduler": {"class_type": "BasicScheduler", "inputs": {"scheduler": "simple", "steps": 20, "denoise": 1.0, "model": ["1", 0]}},
+}
+
+
+def load_parser(source: Path):
+    """Imports the loader module at `source` and returns its WorkflowParser."""
+    spec = importlib.util.spec_from_file_location(f"loader_{abs(hash(source))}", source)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.WorkflowParser
+
+
+def load_baseline(rev: str, workdir: Path):
+    """Writes the loader from git revision `rev` to `workdir` and imports its parser."""
+    source = subprocess.run(
+        ["git", "-C", str(REPO_ROOT), "show", f"{rev}:{LOADER_PATH}"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    path = workdir / "baseline_loader.py"
+    path.write_text(source)
+    return load_parser(path)
+
+
+def make_workflow(
+    node_count: int, placement: str, rng: random.Random, preview_kb: int = 0
+) -> Dict[str, Any]:
+    """
+    Builds a workflow with `node_count` filler nodes plus the titled nodes.
+
+    `placement` is "front", "spread" or "back" and decides where in the graph
+    the titled nodes appear, which matters for the early exit. With
+    `preview_kb`, every 50th filler node carries a string of that size.
+    """
+    preview = "iVBORw0KGgo" * (preview_kb * 1024 // 11)
+    nodes: List[Dict[str, Any]] = []
+    for i in range(node_count):
+        nodes.append(
+            {
+                "class_type": "LoraLoader",
+                "inputs": {
+                    "lora_name": f"lora_{i}.safetensors",
+                    "strength_model": rng.random(),
+                    "strength_clip": rng.random(),
+                    "model": [str(i), 0],
+                    "clip": [str(i), 1],
+                },
+                "_meta": {"title": f"Load LoRA {i}"},
+            }
+        )
+        if preview and i % 50 == 0:
+            nodes[-1]["inputs"]["preview"] = preview
+    titled = [dict(body, _meta={"title": title}) for title, body in TITLED_NODES.items()]
+    if placement == "front":
+        nodes = titled + nodes
+    elif placement == "back":
+        nodes = nodes + titled
+    else:
+        for node in titled:
+            nodes.insert(rng.randrange(len(nodes) + 1), node)
+    return {str(i + 1): node for i, node in enumerate(nodes)}
+
+
+def time_call(func: Callable[[], Any], repeat: int) -> float:
+    """Returns the best wall time of `repeat` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def peak_memory(func: Callable[[], Any]) -> float:
+    """Returns the peak traced allocation of one call, in MiB."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", help="Git revision to compare against")
+    parser.add_argument("--preview-kb", type=int, default=0, help="Size of embedded preview strings")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    parsers = {"current": load_parser(REPO_ROOT / LOADER_PATH)}
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.baseline:
+            parsers[args.baseline] = load_baseline(args.baseline, Path(workdir))
+
+        print(f"{'nodes':>7} {'placement':>9} {'input':>9} " + " ".join(f"{name:>12}" for name in parsers))
+        for count in args.nodes:
+            for placement in ("front", "spread", "back"):
+                workflow = make_workflow(count, placement, rng, args.preview_kb)
+                document = {"id": "bench", "data": {"content": json.dumps(workflow, indent=2)}}
+                for label, data in (("document", document), ("nodes", workflow)):
+                    timings = []
+                    for parser_cls in parsers.values():
+                        instance = parser_cls()
+                        timings.append(time_call(lambda: instance.parse(data), args.repeat))
+                        assert instance.is_complete(), instance.get_missing_nodes()
+                    print(
+                        f"{count:>7} {placement:>9} {label:>9} "
+                        + " ".join(f"{ms:>10.3f}ms" for ms in timings)
+                    )
+                peaks = [peak_memory(lambda: cls().parse(document)) for cls in parsers.values()]
+                print(f"{count:>7} {placement:>9} {'peak mem':>9} " + " ".join(f"{mb:>9.2f}MiB" for mb in peaks))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
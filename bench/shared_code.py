@@ -0,0 +1,50 @@
+"""
+Checks that the code the actions share is still the same in each of them.
+
+Open WebUI installs every function as a single file, so the HTTP pool, retry
+and tracing block (from "# Shared HTTP connection pool." down to the end of
+`traced`) is copied into each action instead of imported. A change to one copy
+has to be made to all of them; this prints a diff against the first action's
+copy for any that differs and exits with 1.
+
+Usage:
+    python bench/shared_code.py
+"""
+
+import difflib
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ACTIONS = [
+    "functions/actions/comfy-workflow-loader/comfy_workflow_loader.py",
+    "functions/actions/quick-image-conf/quick_image_conf.py",
+    "functions/actions/quick-voice-conf/quick_voice_conf.py",
+]
+BLOCK_START = "# Shared HTTP connection pool.\n"
+BLOCK_END = "\n    return wrapper\n"
+
+
+def shared_block(path: str) -> str:
+    """Returns the shared block of the action at `path`."""
+    source = (REPO_ROOT / path).read_text(encoding="utf-8")
+    start = source.index(BLOCK_START)
+    return source[start : source.index(BLOCK_END, start) + len(BLOCK_END)]
+
+
+def main() -> int:
+    reference = shared_block(ACTIONS[0])
+    failed = False
+    for path in ACTIONS[1:]:
+        block = shared_block(path)
+        if block != reference:
+            failed = True
+            sys.stdout.writelines(
+                difflib.unified_diff(reference.splitlines(True), block.splitlines(True), ACTIONS[0], path)
+            )
+    print(f"{len(reference.splitlines())} lines, {'DIFFERENT' if failed else 'identical'} in {len(ACTIONS)} actions")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,13 +9,25 @@ icon_url: data:image/svg+xml,%3C%3Fxml%20version%3D%221.0%22%20encoding%3D%22UTF
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Union, Generator, Iterator, Dict, Any, List
-import aiohttp
-# import asyncio
+from typing import Optional, Union, Dict, Any, Callable, Iterable, Iterator, List, Tuple
+from collections import OrderedDict, deque
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import functools
+import difflib
+import hashlib
 import json
 import os
+import random
 import logging
+import re
+import sys
+import time
 import traceback
+import types
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 if not logger.handlers:
@@ -27,8 +39,697 @@ if not logger.handlers:
     logger.addHandler(handler)
 logger.propagate = False
 logger.setLevel(logging.ERROR)
+_debug_log = logger.debug  # Sink for debug output such as trace spans.
+
+# Node title -> what to read from that node, as (config key, accepted input names).
+# The first input name present on the node is used.
+NODE_EXTRACTION_PLAN: Dict[str, List[tuple]] = {
+    'model': [('model', ('unet_name', 'ckpt_name'))],
+    'positive_prompt': [('prompt', ('text',))],
+    'dimensions': [('width', ('width',)), ('height', ('height',))],
+    'seed': [('seed', ('noise_seed', 'seed'))],
+    'scheduler': [('steps', ('steps',))],
+}
+
+REQUIRED_NODES: List[str] = list(NODE_EXTRACTION_PLAN)
+
+# The only node fields ComfyUI's /prompt API executes; the rest (e.g. _meta) is UI data.
+EXECUTABLE_NODE_FIELDS: Tuple[str, ...] = ('class_type', 'inputs')
+
+# Workflow content at least this long is decoded one node at a time instead of
+# whole: below it json.loads is clearly faster, above it streaming takes about
+# as long and keeps peak memory flat (see bench/parser_bench.py).
+STREAM_MIN_CHARS = 4 * 1024 * 1024
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+# Shared HTTP connection pool.
+# The pool, retry and tracing code down to `traced` is the same in every action,
+# byte for byte (bench/shared_code.py checks this).
+# Open WebUI loads every function as its own module, so the pool registry is kept
+# on a private entry in sys.modules where all of the actions can find it. There is
+# one ClientSession per event loop, which keeps connections to the Open WebUI API
+# and ComfyUI warm between clicks instead of handshaking on every request. The
+# session is closed when its loop shuts down its async generators, which
+# asyncio.run (and so uvicorn) does before closing the loop.
+_HTTP_POOL_MODULE = "_owui_actions_http_pool"
+HTTP_POOL_LIMIT: int = 100  # Connections across all hosts.
+HTTP_POOL_LIMIT_PER_HOST: int = 10
+HTTP_POOL_DNS_TTL: int = 300  # Seconds to cache DNS lookups.
+HTTP_POOL_KEEPALIVE: float = 60.0  # Seconds an idle connection is kept open.
+
+
+def _http_pool() -> types.ModuleType:
+    """Returns the process-wide pool registry, creating it on first use."""
+    pool = sys.modules.get(_HTTP_POOL_MODULE)
+    if pool is None:
+        pool = types.ModuleType(_HTTP_POOL_MODULE)
+        pool.sessions = {}
+        pool.closers = {}
+        sys.modules[_HTTP_POOL_MODULE] = pool
+    return pool
+
+
+def get_http_session():
+    """
+    Returns the pooled aiohttp ClientSession for the running event loop.
+
+    Sessions are created lazily, and replaced if the previous one was closed or
+    belonged to a loop that has since been closed. Callers must not close it.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    pool = _http_pool()
+    sessions: Dict[Any, Any] = pool.sessions
+    closers: Dict[Any, Any] = pool.__dict__.setdefault("closers", {})
+    for stale in [l for l in sessions if l.is_closed()]:
+        del sessions[stale]
+        closers.pop(stale, None)
+
+    session = sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_POOL_DNS_TTL,
+            keepalive_timeout=HTTP_POOL_KEEPALIVE,
+        )
+        # No cookie jar: the session is shared by actions with different tokens.
+        session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar()
+        )
+        sessions[loop] = session
+        # Held here because the loop only keeps a weak reference to it.
+        closers[loop] = _close_at_loop_shutdown(session)
+    return session
+
+
+async def close_http_session() -> None:
+    """Closes the pooled session for the running event loop, if there is one."""
+    session = _http_pool().sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _close_at_loop_shutdown(session: Any) -> Any:
+    """
+    Returns an async generator, parked at its yield, that closes `session`.
+
+    Starting it registers it with the running loop, whose shutdown_asyncgens()
+    then closes it while the loop can still await the session's close().
+    """
+
+    async def closer():
+        try:
+            yield
+        finally:
+            if not session.closed:
+                await session.close()
+
+    generator = closer()
+    try:
+        generator.asend(None).send(None)
+    except StopIteration:
+        pass  # Reached the yield.
+    return generator
+
+
+# Retries and circuit breaking for outbound requests.
+# Circuit state is kept per host on the shared pool registry, so once ComfyUI or
+# the Open WebUI API keeps failing, every action fails fast for a cool-down
+# instead of waiting out its timeout on each request.
+HTTP_RETRY_BASE_DELAY: float = 0.2  # Seconds, doubled per attempt, full jitter.
+HTTP_RETRY_MAX_DELAY: float = 2.0
+HTTP_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open a circuit.
+CIRCUIT_COOLDOWN: float = 30.0  # Seconds an open circuit fails fast.
+
+
+def _circuit(url: str) -> Dict[str, float]:
+    """Returns the circuit state of the host `url` points at."""
+    circuits = _http_pool().__dict__.setdefault("circuits", {})
+    return circuits.setdefault(urlsplit(url).netloc, {"failures": 0, "open_until": 0.0})
+
+
+def _record_outcome(circuit: Dict[str, float], ok: bool) -> None:
+    """Closes the circuit on success, opens it after too many failures in a row."""
+    if ok:
+        circuit["failures"] = 0
+        return
+    circuit["failures"] += 1
+    if circuit["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+        # Half-open after the cool-down: the next failure reopens it right away.
+        circuit["open_until"] = time.monotonic() + CIRCUIT_COOLDOWN
+
+
+@contextlib.asynccontextmanager
+async def http_request(
+    method: str, url: str, *, timeout: Any, retries: int = 0, span: Optional[str] = None, **kwargs: Any
+):
+    """
+    Sends a request on the pooled session and yields the response.
+
+    Connection errors, timeouts and 429/502/503/504 responses are retried up to
+    `retries` times with jittered exponential backoff (only pass retries for
+    idempotent requests). All attempts share the `timeout` budget, so a call
+    never takes longer than `timeout.total`. Requests to a host whose circuit
+    is open fail immediately with `aiohttp.ClientConnectionError`. The call is
+    recorded as a span named `span` when a trace is active.
+    """
+    import aiohttp
+
+    circuit = _circuit(url)
+    deadline = time.monotonic() + timeout.total if timeout.total else None
+    attempt = 0
+    started = time.perf_counter()
+    attempts = 0
+    response = None
+    status: Any = None
+    try:
+        while True:
+            if circuit["open_until"] > time.monotonic():
+                raise aiohttp.ClientConnectionError(f"Circuit open for {urlsplit(url).netloc}")
+            remaining = deadline - time.monotonic() if deadline else None
+            attempt_timeout = aiohttp.ClientTimeout(total=remaining, sock_connect=timeout.sock_connect)
+            attempts += 1
+            error: Optional[BaseException] = None
+            response = None
+            try:
+                response = await get_http_session().request(method, url, timeout=attempt_timeout, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if response is not None and response.status not in HTTP_RETRY_STATUSES:
+                _record_outcome(circuit, response.status < 500)
+                break
+            _record_outcome(circuit, False)
+
+            attempt += 1
+            delay = random.uniform(0, min(HTTP_RETRY_MAX_DELAY, HTTP_RETRY_BASE_DELAY * 2**attempt))
+            if attempt > retries or (deadline and time.monotonic() + delay >= deadline):
+                if response is None:
+                    raise error
+                break  # Out of attempts, hand back the last response.
+            if response is not None:
+                response.release()
+            await asyncio.sleep(delay)
+
+        status = response.status
+        yield response
+    except BaseException as e:
+        status = status or type(e).__name__
+        raise
+    finally:
+        if response is not None:
+            response.release()
+        _trace(
+            span or f"{method} {urlsplit(url).path}",
+            started,
+            status,
+            response.content_length if response is not None else None,
+            attempts,
+        )
+
+
+# Per-invocation tracing.
+# With `enable_debug` on, the action runs with a Tracer in `_TRACE`. Every
+# outbound request and parse step records a span into it, and the action emits
+# a one-line summary of them when it finishes. Background tasks clear it.
+_TRACE: "contextvars.ContextVar[Optional[Tracer]]" = contextvars.ContextVar("owui_action_trace", default=None)
+
+
+class Tracer:
+    """Spans (name, duration, status, bytes) recorded during one action invocation."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def record(
+        self, name: str, duration: float, status: Any = None, size: Optional[int] = None, attempts: int = 1
+    ) -> None:
+        self.spans.append(
+            {"name": name, "ms": round(duration * 1000, 1), "status": status, "bytes": size, "attempts": attempts}
+        )
+
+    def summary(self) -> str:
+        """Spans grouped by name, e.g. "kb list 42ms · file 118ms · config 2×31ms · total 210ms"."""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for span in self.spans:
+            groups.setdefault(span["name"], []).append(span)
+        parts = []
+        for name, spans in groups.items():
+            average = sum(span["ms"] for span in spans) / len(spans)
+            count = f"{len(spans)}×" if len(spans) > 1 else ""
+            failed = [str(span["status"]) for span in spans if span["status"] not in ("ok", 200, 304)]
+            parts.append(f"{name} {count}{average:.0f}ms" + (f" [{', '.join(failed)}]" if failed else ""))
+        parts.append(f"total {(time.perf_counter() - self.started) * 1000:.0f}ms")
+        return " · ".join(parts)
+
+
+def _trace(name: str, started: float, status: Any = None, size: Optional[int] = None, attempts: int = 1) -> None:
+    """Records a span that began at `started` (perf_counter) if a trace is active."""
+    tracer = _TRACE.get()
+    if tracer is not None:
+        tracer.record(name, time.perf_counter() - started, status, size, attempts)
+
+
+@contextlib.contextmanager
+def trace_span(name: str) -> Iterator[None]:
+    """Times the enclosed block as a span."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _trace(name, started, status)
+
+
+def traced(action: Callable) -> Callable:
+    """Wraps `Action.action` so debug runs are traced and end with a timing summary."""
+
+    @functools.wraps(action)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        if not self.valves.enable_debug:
+            return await action(self, *args, **kwargs)
+        tracer = Tracer()
+        token = _TRACE.set(tracer)
+        try:
+            return await action(self, *args, **kwargs)
+        finally:
+            _TRACE.reset(token)
+            _debug_log(json.dumps({"action": __name__, "spans": tracer.spans}))
+            emitter = kwargs.get("__event_emitter__")
+            if emitter:
+                await emitter({"type": "status", "data": {"description": f"⏱ {tracer.summary()}", "done": True}})
+
+    return wrapper
+
+
+class WorkflowNameIndex:
+    """
+    Case-insensitive lookup of workflow names.
+
+    Built once per KB listing. Matching prefers an exact name, then a unique
+    prefix (found by bisecting the sorted names), then the best fuzzy match.
+    Names that only differ in case are all kept; typing one of them exactly
+    picks it, any other spelling lists them all.
+    """
+
+    FUZZY_CUTOFF: float = 0.6  # Minimum similarity for a fuzzy match.
+    FUZZY_MARGIN: float = 0.1  # Lead the best fuzzy match needs over the runner-up.
+    MAX_CANDIDATES: int = 5
+
+    def __init__(self, names: List[str]) -> None:
+        self.by_lower: Dict[str, List[str]] = {}
+        for name in names:
+            self.by_lower.setdefault(name.lower(), []).append(name)
+        self.sorted_lower: List[str] = sorted(self.by_lower)
+
+    def prefixed(self, query: str) -> List[str]:
+        """Returns every name starting with `query`, in sorted order."""
+        query = query.lower()
+        start = bisect.bisect_left(self.sorted_lower, query)
+        # "\uffff" sorts after any character that can follow the prefix.
+        end = bisect.bisect_right(self.sorted_lower, query + "\uffff", lo=start)
+        return [original for name in self.sorted_lower[start:end] for original in self.by_lower[name]]
+
+    def fuzzy(self, query: str) -> List[tuple]:
+        """Returns (score, name) pairs similar to `query`, best first."""
+        query = query.lower()
+        matcher = difflib.SequenceMatcher(b=query, autojunk=False)
+        scored = []
+        for name in self.sorted_lower:
+            if query in name:
+                # Substrings always qualify, scored by how much of the name they cover.
+                score = self.FUZZY_CUTOFF + (1 - self.FUZZY_CUTOFF) * len(query) / len(name)
+            else:
+                matcher.set_seq1(name)
+                # Cheap upper bounds first, the full ratio only for survivors.
+                if matcher.real_quick_ratio() < self.FUZZY_CUTOFF or matcher.quick_ratio() < self.FUZZY_CUTOFF:
+                    continue
+                score = matcher.ratio()
+            if score >= self.FUZZY_CUTOFF:
+                scored.extend((score, original) for original in self.by_lower[name])
+        scored.sort(key=lambda item: (-item[0], item[1].lower()))
+        return scored
+
+    def match(self, query: str) -> List[str]:
+        """
+        Resolves user input to workflow names.
+
+        Args:
+            query (str): What the user typed
+
+        Returns:
+            List[str]: One name if the input resolves unambiguously, otherwise
+                       the candidates (empty if nothing is close)
+        """
+        query = query.strip()
+        exact = self.by_lower.get(query.lower())
+        if exact is not None:
+            return [query] if query in exact else list(exact)
+
+        prefixed = self.prefixed(query)
+        if prefixed:
+            return prefixed
+
+        ranked = self.fuzzy(query)
+        # Only accept the best fuzzy match if it is clearly ahead of the next one.
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < self.FUZZY_MARGIN:
+            return [name for _, name in ranked[: self.MAX_CANDIDATES]]
+        return [name for _, name in ranked[:1]]
+
+
+class KnowledgeListing:
+    """
+    Cached workflow listing of one knowledge base.
+
+    Holds the name -> file id map built from the KB document together with the
+    validators needed to check whether the KB changed since it was fetched, and
+    the missing nodes of each workflow found by background validation.
+    """
+
+    def __init__(
+        self,
+        filename_map: Dict[str, str],
+        updated_at: Optional[Any] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        file_versions: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.filename_map: Dict[str, str] = filename_map
+        self.file_versions: Dict[str, Any] = file_versions or {}
+        self.index = WorkflowNameIndex(list(filename_map))
+        self.updated_at = updated_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at: float = time.monotonic()
+        # File id -> missing required nodes ([] means loadable).
+        self.validation: Dict[str, List[str]] = {}
+        self.validation_task: Optional["asyncio.Future"] = None
+
+    def inherit_validation(self, previous: "KnowledgeListing") -> None:
+        """Keeps validation results of files whose version did not change."""
+        for file_id, missing in previous.validation.items():
+            version = self.file_versions.get(file_id)
+            if version is not None and version == previous.file_versions.get(file_id):
+                self.validation[file_id] = missing
+
+    def is_fresh(self, ttl: float) -> bool:
+        """True if the listing was (re)validated less than `ttl` seconds ago."""
+        return time.monotonic() - self.checked_at < ttl
+
+    def touch(self, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Marks the listing as revalidated, keeping any new validators."""
+        self.checked_at = time.monotonic()
+        self.etag = etag or self.etag
+        self.last_modified = last_modified or self.last_modified
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers for a conditional GET of the KB document."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+# Listings keyed by (api_base_url, knowledge_base_id), shared by all loader instances.
+_LISTING_CACHE: Dict[tuple, KnowledgeListing] = {}
+
+
+class CachedWorkflow:
+    """A fetched workflow file together with the result of parsing it."""
+
+    def __init__(
+        self,
+        workflow_data: dict,
+        content_hash: str,
+        img_config: Dict[str, Any],
+        missing_nodes: List[str],
+        version: Optional[Any] = None,
+    ) -> None:
+        self.workflow_data = workflow_data
+        self.content_hash = content_hash
+        self.img_config = img_config
+        self.missing_nodes = missing_nodes
+        self.version = version
+        self.compact_content: Optional[str] = None
+
+
+class WorkflowCache:
+    """
+    Bounded LRU of parsed workflows keyed by file id.
+
+    An entry is reused without a download when the KB listing reports the same
+    file version, and without a reparse when the downloaded content hashes the same.
+    """
+
+    def __init__(self, max_entries: int = 16) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, CachedWorkflow]" = OrderedDict()
+
+    def get(self, file_id: str) -> Optional[CachedWorkflow]:
+        entry = self.entries.get(file_id)
+        if entry is not None:
+            self.entries.move_to_end(file_id)
+        return entry
+
+    def put(self, file_id: str, entry: CachedWorkflow) -> None:
+        self.entries[file_id] = entry
+        self.entries.move_to_end(file_id)
+        while len(self.entries) > max(self.max_entries, 0):
+            self.entries.popitem(last=False)
+
+    def offer(self, file_id: str, entry: CachedWorkflow) -> None:
+        """
+        Adds an entry nobody has used yet as the first to go, if there is room.
+
+        Unlike put it never replaces or reorders an entry and never evicts one.
+        """
+        if file_id in self.entries or len(self.entries) >= self.max_entries:
+            return
+        self.entries[file_id] = entry
+        self.entries.move_to_end(file_id, last=False)
+
+
+_WORKFLOW_CACHE = WorkflowCache()
+
+
+class AppliedWorkflow:
+    """
+    The workflow the loader last applied to an Open WebUI instance.
+
+    While it is fresh, re-selecting the same workflow is checked against it
+    instead of the images config, which carries the whole workflow.
+    """
+
+    def __init__(self, file_id: Optional[str], base_url: str, digest: str) -> None:
+        self.file_id = file_id
+        self.base_url = base_url  # COMFYUI_BASE_URL it was applied with.
+        self.digest = digest  # See Action.workflow_section and Action.config_digest.
+        self.applied_at = time.monotonic()
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.monotonic() - self.applied_at < ttl
+
+
+# Keyed by api_base_url, shared by all loader instances.
+_APPLIED_WORKFLOWS: Dict[str, AppliedWorkflow] = {}
+
+# COMFYUI_BASE_URL Open WebUI used before the loader first routed a load to one of
+# several servers, keyed by (api_base_url, primary url). It stands in for the
+# Open WebUI address of a primary `comfyui_url` given without `|owui_url`.
+_PRIMARY_BASE_URLS: Dict[Tuple[str, str], str] = {}
+
+
+class ComfyBackend:
+    """
+    One ComfyUI instance and the state it last reported.
+
+    `url` is where the loader reaches it, `base_url` what Open WebUI is told
+    to use (they differ when Open WebUI runs in a container). A None
+    `base_url` leaves Open WebUI's current COMFYUI_BASE_URL alone.
+    """
+
+    def __init__(self, url: str, base_url: Optional[str] = None) -> None:
+        self.url = url.rstrip("/")
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.stats: Optional[dict] = None
+        self.queue_depth: Optional[int] = None
+
+    @property
+    def label(self) -> str:
+        return urlsplit(self.url).netloc or self.url
+
+    @property
+    def devices(self) -> List[dict]:
+        return (self.stats or {}).get("devices") or []
+
+    @property
+    def vram_free(self) -> int:
+        return sum(device.get("vram_free", 0) for device in self.devices)
+
+    @property
+    def available(self) -> bool:
+        return self.stats is not None and self.queue_depth is not None
+
+
+class TelemetrySample:
+    """VRAM per device, RAM and queue length of one server at one point in time."""
+
+    __slots__ = ("time", "devices", "ram_total", "ram_free", "queue_depth")
+
+    def __init__(self, stats: dict, queue_depth: Optional[int]) -> None:
+        self.time = time.monotonic()
+        self.devices: List[Tuple[str, int, int]] = [
+            (device.get("name", ""), device.get("vram_total", 0), device.get("vram_free", 0))
+            for device in stats.get("devices") or []
+        ]
+        system = stats.get("system") or {}
+        self.ram_total: Optional[int] = system.get("ram_total")
+        self.ram_free: Optional[int] = system.get("ram_free")
+        self.queue_depth = queue_depth
+
+
+class BackendTelemetry:
+    """Ring buffer of the samples taken from one ComfyUI server."""
+
+    def __init__(self, history: int) -> None:
+        self.samples: "deque[TelemetrySample]" = deque(maxlen=max(history, 1))
+        self.stats: Optional[dict] = None
+        self.queue_depth: Optional[int] = None
+        self.updated_at = 0.0
+        # Last time the server was seen working, and last automatic unload.
+        self.last_busy = time.monotonic()
+        self.auto_unloaded_at = float("-inf")
+
+    def record(self, backend: ComfyBackend, history: int) -> None:
+        if self.samples.maxlen != max(history, 1):
+            self.samples = deque(self.samples, maxlen=max(history, 1))
+        self.stats = backend.stats
+        self.queue_depth = backend.queue_depth
+        self.updated_at = time.monotonic()
+        if backend.stats is not None:
+            sample = TelemetrySample(backend.stats, backend.queue_depth)
+            if sample.queue_depth or self.vram_moved(sample):
+                self.last_busy = sample.time
+            self.samples.append(sample)
+
+    def vram_moved(self, sample: TelemetrySample) -> bool:
+        """True if VRAM use changed noticeably since the previous sample, i.e. a job ran in between."""
+        if not self.samples:
+            return False
+        previous = self.samples[-1].devices
+        return len(previous) != len(sample.devices) or any(
+            abs(before[2] - after[2]) > 256 * 1024**2 for before, after in zip(previous, sample.devices)
+        )
+
+    def vram_used_range(self, device_index: int) -> Optional[Tuple[int, int, int]]:
+        """
+        Summarises the VRAM used by one device over the kept samples.
+
+        Returns:
+            Optional[Tuple[int, int, int]]: Minimum, maximum and change from the oldest to
+                                            the newest sample in bytes, None with fewer than two samples
+        """
+        used = [
+            sample.devices[device_index][1] - sample.devices[device_index][2]
+            for sample in self.samples
+            if len(sample.devices) > device_index
+        ]
+        if len(used) < 2:
+            return None
+        return min(used), max(used), used[-1] - used[0]
+
+
+class TelemetryPoller:
+    """
+    Samples every configured ComfyUI server in the background.
+
+    One polling task runs per process, using the valves of the loader
+    instance that ran most recently, so the modal can show the latest sample
+    without waiting for ComfyUI. It only runs while something uses the
+    samples (see Action.telemetry_wanted). The running poller is registered on
+    the shared pool registry, so one from a previous copy of this module
+    (e.g. before the function was edited) is stopped when a new one starts.
+    """
+
+    def __init__(self) -> None:
+        self.backends: Dict[str, BackendTelemetry] = {}
+        self.task: Optional["asyncio.Task"] = None
+        self.action: Optional["Action"] = None
+
+    def start(self, action: "Action") -> None:
+        """Starts polling on the running event loop unless it already is, and picks up new valves."""
+        self.action = action
+        if not action.telemetry_wanted():
+            self.stop()
+            return
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.stop()
+            pool = _http_pool()
+            previous = getattr(pool, "telemetry", None)
+            if previous is not None and previous is not self:
+                previous.stop()
+            pool.telemetry = self
+            self.task = loop.create_task(self.run())
+
+    def stop(self) -> None:
+        """Cancels the polling task, if there is one."""
+        task, self.task = self.task, None
+        if task is not None and not task.done():
+            task.cancel()
+
+    async def run(self) -> None:
+        _TRACE.set(None)
+        while self.action is not None and self.action.telemetry_wanted():
+            await asyncio.sleep(self.action.valves.telemetry_interval)
+            try:
+                backends = await self.poll(self.action)
+                await self.action.apply_unload_policy(backends)
+            except Exception as e:
+                logger.error(f"Error polling ComfyUI telemetry: {e!r}")
+
+    async def poll(self, action: "Action", backends: Optional[List[ComfyBackend]] = None) -> List[ComfyBackend]:
+        """Polls the servers once and records a sample for each of them."""
+        backends = await action.poll_backends(backends or action.get_backends())
+        for backend in backends:
+            if backend.url not in self.backends:
+                self.backends[backend.url] = BackendTelemetry(action.valves.telemetry_history)
+            self.backends[backend.url].record(backend, action.valves.telemetry_history)
+        # Forget servers that were removed from the valves.
+        configured = {backend.url for backend in backends}
+        for url in [url for url in self.backends if url not in configured]:
+            del self.backends[url]
+        return backends
+
+    def fill(self, backends: List[ComfyBackend], max_age: float) -> bool:
+        """
+        Fills the servers from the latest samples.
+
+        Returns:
+            bool: False if any server has no sample younger than `max_age` seconds
+        """
+        now = time.monotonic()
+        telemetry = [self.backends.get(backend.url) for backend in backends]
+        if any(entry is None or now - entry.updated_at > max_age for entry in telemetry):
+            return False
+        for backend, entry in zip(backends, telemetry):
+            backend.stats = entry.stats
+            backend.queue_depth = entry.queue_depth
+        return True
+
 
-REQUIRED_NODES: List[str] = ['model', 'positive_prompt', 'dimensions', 'seed', 'scheduler']
+# Shared by all loader instances, see TelemetryPoller.
+_TELEMETRY = TelemetryPoller()
 
 
 class Action:
@@ -51,16 +752,97 @@ class Action:
         )
         comfyui_url: str = Field(
             default="http://localhost:8188",
-            description="URL of the ComfyUI server",
+            description="URL of the ComfyUI server. Use `url|owui_url` to also point Open WebUI at `owui_url`, otherwise its ComfyUI Base URL is left as is",
+        )
+        comfyui_backends: str = Field(
+            default="",
+            description="Additional ComfyUI servers, comma separated. Each load picks the one with the shortest queue and most free VRAM. Use `url|owui_url` when Open WebUI reaches a server by another address",
         )
         show_vram: bool = Field(
             default=False,
             description="Show VRAM usage in the workflow selection modal",
         )
+        request_timeout: float = Field(
+            default=30.0,
+            description="Seconds before an API or ComfyUI request is abandoned",
+        )
+        connect_timeout: float = Field(
+            default=10.0,
+            description="Seconds allowed to open a new connection",
+        )
+        status_timeout: float = Field(
+            default=5.0,
+            description="Seconds before a ComfyUI status request (/system_stats, /queue, /history) is abandoned",
+        )
+        http_retries: int = Field(
+            default=2,
+            description="Extra attempts for failed read requests, within the same timeout",
+        )
+        listing_cache_ttl: float = Field(
+            default=300.0,
+            description="Seconds the workflow list, and the record of the last applied workflow, are reused before checking for changes (0 checks every time)",
+        )
+        workflow_cache_size: int = Field(
+            default=16,
+            description="Number of recently used workflows kept parsed in memory (0 disables)",
+        )
+        prevalidate_workflows: bool = Field(
+            default=True,
+            description="Check every workflow in the knowledge base for missing nodes in the background",
+        )
+        validation_concurrency: int = Field(
+            default=4,
+            description="Workflows fetched in parallel by the background validation",
+        )
+        hide_broken_workflows: bool = Field(
+            default=False,
+            description="Leave workflows with missing nodes out of the list instead of annotating them",
+        )
+        compact_workflow: bool = Field(
+            default=False,
+            description="Store the workflow minified and without UI-only fields (smaller config and generation requests)",
+        )
+        warmup_after_load: bool = Field(
+            default=False,
+            description="Queue a tiny generation after loading so the model is already in VRAM for the first real image",
+        )
+        warmup_steps: int = Field(
+            default=1,
+            description="Sampling steps used for the warm-up generation",
+        )
+        warmup_size: int = Field(
+            default=64,
+            description="Width and height in pixels of the warm-up image",
+        )
+        warmup_timeout: float = Field(
+            default=180.0,
+            description="Seconds to wait for the warm-up generation to finish",
+        )
+        telemetry_interval: float = Field(
+            default=10.0,
+            description="Seconds between background VRAM and queue samples of the ComfyUI servers (0 fetches them on every click instead)",
+        )
+        telemetry_history: int = Field(
+            default=60,
+            description="Samples kept per ComfyUI server for the min/max/trend shown in the modal",
+        )
+        auto_unload_free_vram_gb: float = Field(
+            default=0.0,
+            description="Unload models on an idle ComfyUI server when a device has less free VRAM than this, in GB (0 disables, needs telemetry)",
+        )
+        auto_unload_idle_minutes: float = Field(
+            default=0.0,
+            description="Unload models and free cached memory after a ComfyUI server was idle this long (0 disables, needs telemetry)",
+        )
+        evict_on_model_change: bool = Field(
+            default=False,
+            description="Unload the previous model before using a workflow with a different model",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
 
+    @traced
     async def action(
         self,
         body: dict,
@@ -81,6 +863,7 @@ class Action:
             dict|None: Response data or None on error
         """
         print(f"ACTION:{__name__}")
+        logger.setLevel(logging.DEBUG if self.valves.enable_debug else logging.ERROR)
 
         # Make event emitter available for resuable func
         self.__event_emitter__ = __event_emitter__
@@ -92,22 +875,59 @@ class Action:
         # Empty vars for later.
         vram_info: str = ""
 
+        # Stats and the workflow listing are independent, fetch them together.
+        # Keep sampling the ComfyUI servers in the background (or stop, if nothing needs it).
+        _TELEMETRY.start(self)
+
+        fetches = [self.get_listing(self.valves.knowledge_base_id)]
+        if self.valves.show_vram:
+            fetches.append(self.get_vram_snapshot())
+        listing, *backends = await asyncio.gather(*fetches)
+
         # Is VRAM info enabled?
         if self.valves.show_vram:
-            stats: Optional[dict] = await self.get_comfyui_stats()
-            if stats is not None:
-                vram_info = self.format_vram_info(stats)
-            else:
-                vram_info = "VRAM info unavailable"
-        
+            vram_info = self.format_vram_info(backends[0])
+
         # We need the worflow names.
-        workflows = await self.get_workflows(self.valves.knowledge_base_id)
-        if not workflows:
+        if not listing or not listing.filename_map:
             await self.emit_event("Unable to get workflows, exiting.", True)
+            return
+
+        # Check the workflows for missing nodes while the modal is open.
+        self.start_validation(listing)
 
-        filename_map = self.get_file_names(workflows)
+        # The current image config is only needed once a workflow is chosen,
+        # fetch it while the user is still typing. The images config (which
+        # carries the whole workflow) is fetched by handle_selection, alongside
+        # the workflow file, once the choice is known.
+        config_task = asyncio.ensure_future(self.get_current_image_config())
+        try:
+            await self.handle_selection(__event_call__, vram_info, listing, config_task)
+        finally:
+            if not config_task.done():
+                config_task.cancel()
+                # Retrieve the cancellation so asyncio does not log it as unhandled.
+                config_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def handle_selection(
+        self,
+        __event_call__,
+        vram_info: str,
+        listing: KnowledgeListing,
+        config_task: "asyncio.Future",
+    ) -> None:
+        """
+        Shows the selection modal and loads (or unloads) based on the reply.
+
+        Args:
+            __event_call__: Function to call events
+            vram_info (str): VRAM summary for the modal message
+            listing (KnowledgeListing): Workflows available in the knowledge base
+            config_task (asyncio.Future): Prefetch of the current image config
+        """
+        filename_map = listing.filename_map
         # Prep list of workflows for display
-        filenames_str = "\n".join(filename_map.keys())
+        filenames_str = self.format_workflow_list(listing)
 
         # Show the modal.
         response = None
@@ -133,71 +953,374 @@ class Action:
                 logger.error("Problem unloading models.")
             # We are done, models unloaded, message sent.
             return
+
+        # Was it empty?
+        if not response or not isinstance(response, str):
+            await self.emit_event("No changes made.", True)
+            return
+        # At least 3 chars?
+        if len(response.strip()) <= 2:
+            await self.emit_event("Input a minimum of three characters.", True)
+            return
+
+        # Get the workflow data from the user input, strip newlines, try to match it.
+        response = response.strip()
+        with trace_span("match"):
+            matches: List[str] = listing.index.match(response)
+        if not matches:
+            # The listing may be cached, check for newly added workflows before giving up.
+            refreshed = await self.get_listing(self.valves.knowledge_base_id, force=True)
+            if refreshed and refreshed is not listing:
+                listing = refreshed
+                filename_map = listing.filename_map
+                matches = listing.index.match(response)
+
+        if len(matches) == 1:  # Exact, unique prefix or clear fuzzy match
+            workflow_base_name = matches[0]
+
+        elif len(matches) > 1:  # Multiple matches
+            await self.emit_event(f"Multiple matches found: {', '.join(matches)}\nPlease be more specific.", True)
+            return
+
         else:
-            # Was it empty?
-            if not response:
-                await self.emit_event("No changes made.", True)
-            # At least 3 chars?
-            elif len(response) <= 2:
-                await self.emit_event("Input a minimum of three characters.", True)
-
-            # Get the workflow data from the user input, strip newlines, try to match it.
-            response = str(response).strip()
-            matches: List[str] = [
-                name for name in filename_map.keys() if name.lower().startswith(response.lower())
-            ]
-
-            if len(matches) == 1:  # Exact match or unique partial match
-                workflow_base_name = matches[0]
-
-            # [todo] Need to fix this, "test" and "testing" means "test" cannot be selected."
-            elif len(matches) > 1:  # Multiple matches
-                await self.emit_event(f"Multiple matches found: {', '.join(matches)}\nPlease be more specific.", True)
+            await self.emit_event("No matching workflow found. Please try again.", True)
+            return
+
+        # Need to get the workflow and send to update config
+        workflow_id = filename_map[workflow_base_name]
+        if not workflow_id:
+            await self.emit_event(f"Unable to fetch {workflow_base_name}, exiting.", True)
+            logger.error(f"workflow_id: {workflow_id}")
+            return
+
+        # Already known to be broken, no need to fetch it.
+        if listing.validation.get(workflow_id):
+            await self.emit_event(f"Workflow missing nodes: {listing.validation[workflow_id]}", True)
+            return
 
+        # Worflow data, the config prefetch is usually finished by now. With several
+        # ComfyUI servers, their load is polled at the same time. The images config
+        # is fetched alongside, unless this workflow is the one applied last: then
+        # update_all can usually tell without it that the workflow section is
+        # unchanged and only posts the image config if that differs. Any other
+        # workflow changes the workflow section, so fetching in parallel here
+        # saves a round trip over fetching it in update_all.
+        fetches = [
+            self.load_workflow(workflow_id, listing.file_versions.get(workflow_id), workflow_base_name),
+            config_task,
+            self.route_backend(),
+        ]
+        applied = _APPLIED_WORKFLOWS.get(self.valves.api_base_url)
+        if not (applied and applied.file_id == workflow_id and applied.is_fresh(self.valves.listing_cache_ttl)):
+            fetches.append(self.get_current_config())
+        workflow_data, current_image_config, backend, *current_config = await asyncio.gather(*fetches)
+        if not workflow_data:
+            return  # load_workflow has reported why.
+
+        # Update
+        previous_model = (current_image_config or {}).get("MODEL")
+        complete = await self.update_all(
+            workflow_data,
+            current_config[0] if current_config else None,
+            current_image_config,
+            (backend or self.get_backends()[0]).base_url,
+        )
+        if self.valves.enable_debug:
+            logger.debug(f"RESPONSE: {response}")
+        loaded = f"Workflow \"{workflow_base_name}\" loaded" + (f" on {backend.label}" if backend else "")
+        if complete is not True:
+            await self.emit_event(complete or "There was a problem :/ Check the logs.", True)
+            logger.error(f"complete: {complete}")
+            return
+
+        comfyui_url = backend.url if backend else self.get_backends()[0].url
+        parsed = self.parse_workflow(workflow_data)
+        model = parsed.img_config["model"]["value"]
+        if self.valves.evict_on_model_change and previous_model and previous_model != model:
+            await self.emit_event(f"{loaded}, unloading {previous_model}...", False)
+            evicted, message = await self.free_models(comfyui_url)
+            if not evicted:
+                logger.error(f"Could not unload {previous_model}: {message}")
+
+        if self.valves.warmup_after_load:
+            await self.emit_event(f"{loaded}, warming up the model...", False)
+            warmed = await self.warm_up(parsed, comfyui_url)
+            if warmed:
+                await self.emit_event(f"{loaded}, model warmed up.", True)
             else:
-                await self.emit_event("No matching workflow found. Please try again.", True)
+                await self.emit_event(f"{loaded} (warm-up failed, check the logs).", True)
+        else:
+            await self.emit_event(f"{loaded}.", True)
+
+    # Model warm-up
+    async def warm_up(self, parsed: CachedWorkflow, comfyui_url: str) -> bool:
+        """
+        Queues a minimal generation of the workflow on ComfyUI and waits for it.
+
+        Loading the checkpoint/UNet into VRAM is what makes the first image after a
+        switch slow, so a tiny low-step run moves that cost out of the way.
+
+        Args:
+            parsed (CachedWorkflow): The workflow that was just loaded
+            comfyui_url (str): ComfyUI server the workflow was loaded for
 
-            # Need to get the workflow and send to update config
-            workflow_id = filename_map[workflow_base_name]
-            if not workflow_id:
-                await self.emit_event(f"Unable to fetch {workflow_base_name}, exiting.", True)
-                logger.error(f"workflow_id: {workflow_id}")
+        Returns:
+            bool: True once the warm-up generation completed
+        """
+        import aiohttp
 
-            # Worflow data
-            workflow_data = await self.get_workflow(workflow_id)
+        prompt = self.build_warmup_prompt(parsed)
+        try:
+            async with http_request(
+                "POST",
+                f"{comfyui_url}/prompt",
+                json={"prompt": prompt, "client_id": "owui-workflow-loader-warmup"},
+                timeout=self.get_timeout(),
+                span="prompt",
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error queueing warm-up: {await response.text()}")
+                    return False
+                prompt_id = (await response.json()).get("prompt_id")
+            if not prompt_id:
+                logger.error("Warm-up was queued without a prompt_id")
+                return False
+
+            started = time.monotonic()
+            while time.monotonic() - started < self.valves.warmup_timeout:
+                async with http_request(
+                    "GET",
+                    f"{comfyui_url}/history/{prompt_id}",
+                    timeout=self.get_timeout(self.valves.status_timeout),
+                    retries=self.valves.http_retries,
+                    span="history",
+                ) as response:
+                    history = await response.json() if response.status == 200 else {}
+                status = history.get(prompt_id, {}).get("status", {})
+                if status.get("completed"):
+                    return True
+                if status.get("status_str") == "error":
+                    logger.error(f"Warm-up failed: {status.get('messages')}")
+                    return False
+                await self.emit_event(f"Warming up the model ({time.monotonic() - started:.0f}s)...", False)
+                await asyncio.sleep(1.0)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Error during warm-up: {e!r}")
+            return False
+
+        logger.error(f"Warm-up did not finish within {self.valves.warmup_timeout}s")
+        return False
+
+    def build_warmup_prompt(self, parsed: CachedWorkflow) -> Dict[str, Any]:
+        """
+        Builds a ComfyUI prompt from the workflow with tiny, low-step settings.
+
+        Prompt, size, steps and seed are overridden on the nodes the parser found,
+        and SaveImage nodes become PreviewImage so nothing lands in the output folder.
+        """
+        nodes = json.loads(self.compact_workflow_content(parsed.workflow_data['data']['content']))
+        overrides = {
+            'prompt': 'warm-up',
+            'width': self.valves.warmup_size,
+            'height': self.valves.warmup_size,
+            'steps': self.valves.warmup_steps,
+            'seed': 0,
+        }
+        for config_key, value in overrides.items():
+            entry = parsed.img_config.get(config_key)
+            if entry and entry['node_id'] in nodes:
+                nodes[entry['node_id']].setdefault('inputs', {})[entry['key']] = value
+
+        for node in nodes.values():
+            if node.get('class_type') == 'SaveImage':
+                node['class_type'] = 'PreviewImage'
+                node['inputs'] = {'images': node.get('inputs', {}).get('images')}
+        return nodes
+
+    # Background validation
+    def start_validation(self, listing: KnowledgeListing) -> None:
+        """Starts validating the listing's unchecked workflows, unless already running."""
+        if not self.valves.prevalidate_workflows:
+            return
+        if listing.validation_task is not None and not listing.validation_task.done():
+            return
+        pending = [file_id for file_id in dict.fromkeys(listing.filename_map.values()) if file_id not in listing.validation]
+        if pending:
+            listing.validation_task = asyncio.ensure_future(self.validate_workflows(listing, pending))
+
+    async def validate_workflows(self, listing: KnowledgeListing, file_ids: List[str]) -> None:
+        """
+        Fetches and parses workflows concurrently, recording their missing nodes.
+
+        Results go to `listing.validation`. Workflows that could not be fetched
+        are left unrecorded and retried on the next run. Parsed workflows are
+        offered to the workflow cache, so selecting one afterwards skips the
+        download; they only fill free slots, so validating a large KB does not
+        evict or reorder the recently used ones.
+
+        Args:
+            listing (KnowledgeListing): Listing the workflows belong to
+            file_ids (List[str]): Workflows to validate
+        """
+        # Runs in the background, keep it out of the invocation's trace.
+        _TRACE.set(None)
+        _WORKFLOW_CACHE.max_entries = self.valves.workflow_cache_size
+        semaphore = asyncio.Semaphore(max(self.valves.validation_concurrency, 1))
+
+        async def validate(file_id: str) -> None:
+            cached = _WORKFLOW_CACHE.entries.get(file_id)
+            version = listing.file_versions.get(file_id)
+            if cached is not None and version is not None and cached.version == version:
+                listing.validation[file_id] = cached.missing_nodes
+                return
+            async with semaphore:
+                workflow_data = await self.get_workflow(file_id)
             if not workflow_data:
-                logger.error(f"workflow_data: {workflow_data}")
-                await self.emit_event("Unable to fetch workflow, exiting.", True)
+                return
+            parser = WorkflowParser()
+            try:
+                img_config = parser.parse(workflow_data)
+            except ValueError as e:
+                logger.error(f"Invalid workflow {file_id}: {e}")
+                listing.validation[file_id] = list(REQUIRED_NODES)
+                return
+            missing_nodes = list(parser.get_missing_nodes())
+            listing.validation[file_id] = missing_nodes
+            _WORKFLOW_CACHE.offer(
+                file_id,
+                CachedWorkflow(workflow_data, self.get_content_hash(workflow_data), img_config, missing_nodes, version),
+            )
 
-            else:
-                # Update
-                complete = await self.update_all(workflow_data)
-            if not complete:
-                await self.emit_event("There was a problem :/ Check the logs.", True)
-                logger.error(f"complete: {complete}")
-            else:
-                await self.emit_event(f"Workflow \"{workflow_base_name}\" loaded.", True)
-            if self.valves.enable_debug:
-                logger.debug(f"RESPONSE: {response}")
+        try:
+            await asyncio.gather(*(validate(file_id) for file_id in file_ids))
+        except Exception as e:
+            logger.error(f"Exception in validate_workflows: {e!r}")
+
+    def format_workflow_list(self, listing: KnowledgeListing) -> str:
+        """Workflow names for the modal, with broken ones annotated or hidden."""
+        lines = []
+        for name, file_id in listing.filename_map.items():
+            missing = listing.validation.get(file_id)
+            if not missing:
+                lines.append(name)
+            elif not self.valves.hide_broken_workflows:
+                lines.append(f"{name} (missing: {', '.join(missing)})")
+        return "\n".join(lines)
+
+    # Workflow cache
+    async def load_workflow(
+        self, workflow_id: str, version: Optional[Any] = None, name: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Returns a workflow file, skipping the download if the cached copy is current.
+
+        A failed download or a file that is not valid JSON is reported with an
+        error status before returning None.
+
+        Args:
+            workflow_id (str): File id of the workflow
+            version (Optional[Any]): File hash or updated_at from the KB listing
+            name (Optional[str]): Workflow name for the status messages
+
+        Returns:
+            Optional[dict]: Workflow data if successful, None otherwise
+        """
+        _WORKFLOW_CACHE.max_entries = self.valves.workflow_cache_size
+        cached = _WORKFLOW_CACHE.get(workflow_id)
+        if cached and version is not None and cached.version == version:
+            return cached.workflow_data
+
+        workflow_data = await self.get_workflow(workflow_id)
+        if not workflow_data:
+            logger.error(f"workflow_data: {workflow_data}")
+            await self.emit_event("Unable to fetch workflow, exiting.", True)
+            return None
+        try:
+            # Cache it under the listing's version so the next selection skips the download.
+            self.parse_workflow(workflow_data, version)
+        except ValueError as e:  # json.JSONDecodeError included
+            logger.error(f"Invalid workflow {name or workflow_id}: {e}")
+            await self.emit_event(f"Invalid workflow \"{name or workflow_id}\": {e}", True)
+            return None
+        return workflow_data
+
+    def parse_workflow(self, workflow_data: dict, version: Optional[Any] = None) -> CachedWorkflow:
+        """
+        Parses a workflow file, reusing the cached result for identical content.
+
+        Args:
+            workflow_data (dict): Workflow file as returned by the files API
+            version (Optional[Any]): File version from the KB listing, if known
+
+        Returns:
+            CachedWorkflow: The parsed configuration and any missing nodes
+        """
+        _WORKFLOW_CACHE.max_entries = self.valves.workflow_cache_size
+        file_id = workflow_data.get("id")
+        content_hash = self.get_content_hash(workflow_data)
+        cached = _WORKFLOW_CACHE.get(file_id) if file_id else None
+        if cached and cached.content_hash == content_hash:
+            if version is not None:
+                cached.version = version
+            return cached
+
+        parser = WorkflowParser()
+        with trace_span("parse"):
+            img_config = parser.parse(workflow_data)
+        entry = CachedWorkflow(
+            workflow_data,
+            content_hash,
+            img_config,
+            list(parser.get_missing_nodes()),
+            version,
+        )
+        if file_id:
+            _WORKFLOW_CACHE.put(file_id, entry)
+        return entry
+
+    def get_content_hash(self, workflow_data: dict) -> str:
+        """Hashes the workflow content (data.content) of a file."""
+        content = workflow_data.get("data", {}).get("content", "")
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
     # Update 
-    async def update_all(self, workflow_data: dict) -> bool | str:
+    async def update_all(
+        self,
+        workflow_data: dict,
+        current_config: Optional[dict] = None,
+        current_image_config: Optional[dict] = None,
+        comfyui_base_url: Optional[str] = None,
+    ) -> bool | str:
         """
         Updates image settings and workflow configuration.
+
+        Each section is compared with the current server state by content hash
+        and only posted if it changed. When the workflow section is the one this
+        loader last applied (for up to listing_cache_ttl seconds), the images
+        config is not even fetched, so re-selecting the active workflow costs the
+        image config request, plus its update if the image config differs.
         
         Args:
             workflow_data (dict): Workflow data to process
+            current_config (Optional[dict]): Prefetched images config, fetched here if None
+            current_image_config (Optional[dict]): Prefetched image config, if None it is always posted
+            comfyui_base_url (Optional[str]): ComfyUI server to point Open WebUI at, None for the primary server (keeps the current one with a single server)
             
         Returns:
             bool | str: True on success, error message or False on failure
         """
-        parser = WorkflowParser()
-        parsed_workflow_data = parser.parse(workflow_data)
+        try:
+            parsed = self.parse_workflow(workflow_data)
+        except ValueError as e:
+            logger.error(f"Invalid workflow: {e}")
+            return f"Invalid workflow: {e}"
+        parsed_workflow_data = parsed.img_config
 
-        if not parser.is_complete():
-            logger.debug(f"current_config: {parser.get_missing_nodes()}")
-            return f"Workflow missing nodes: {parser.get_missing_nodes()}"
-            logger.error(parsed_workflow_data["data"]["content"])
+        if parsed.missing_nodes:
+            logger.debug(f"current_config: {parsed.missing_nodes}")
+            return f"Workflow missing nodes: {parsed.missing_nodes}"
 
         # Update image config settings
         image_config = {
@@ -205,82 +1328,212 @@ class Action:
             "IMAGE_SIZE": f"{parsed_workflow_data['width']['value']}x{parsed_workflow_data['height']['value']}",
             "IMAGE_STEPS": parsed_workflow_data["steps"]["value"],
         }
-        current_config = await self.get_current_config()
+        workflow_nodes = [
+            {
+                "type": "prompt",
+                "key": "text",
+                "node_ids": [parsed_workflow_data["prompt"]["node_id"]],
+            },
+            {
+                "type": "model",
+                "key": parsed_workflow_data["model"]["key"],
+                "node_ids": [parsed_workflow_data["model"]["node_id"]],
+            },
+            {
+                "type": "width",
+                "key": "width",
+                "node_ids": [parsed_workflow_data["width"]["node_id"]],
+            },
+            {
+                "type": "height",
+                "key": "height",
+                "node_ids": [parsed_workflow_data["height"]["node_id"]],
+            },
+            {
+                "type": "steps",
+                "key": "steps",
+                "node_ids": [parsed_workflow_data["steps"]["node_id"]],
+            },
+            {
+                "type": "seed",
+                "key": parsed_workflow_data["seed"]["key"],
+                "node_ids": [parsed_workflow_data["seed"]["node_id"]],
+            },
+        ]
+        image_changed = current_image_config is None or self.config_digest(
+            self.image_section(image_config)
+        ) != self.config_digest(self.image_section(current_image_config))
+
+        # With several servers, a primary without `|owui_url` still needs a concrete
+        # address, or a load routed to it would leave Open WebUI on the last secondary.
+        backends = self.get_backends()
+        primary_key = (self.valves.api_base_url, backends[0].url)
+        routed = len(backends) > 1
+        if routed and comfyui_base_url is None:
+            comfyui_base_url = _PRIMARY_BASE_URLS.get(primary_key)
+
+        import aiohttp
+
+        # The images config is only fetched once the workflow section may differ
+        # from what this loader last applied, so re-selecting the active workflow
+        # after e.g. Quick Image Config changed the steps costs a single POST.
+        applied = _APPLIED_WORKFLOWS.get(self.valves.api_base_url)
+        if (
+            current_config is None
+            and (comfyui_base_url is not None or not routed)
+            and applied is not None
+            and applied.is_fresh(self.valves.listing_cache_ttl)
+        ):
+            proposed = self.workflow_section({
+                "COMFYUI_BASE_URL": comfyui_base_url or applied.base_url,
+                "COMFYUI_WORKFLOW": self.get_workflow_content(parsed),
+                "COMFYUI_WORKFLOW_NODES": workflow_nodes,
+            })
+            if self.config_digest(proposed) == applied.digest:
+                if self.valves.enable_debug:
+                    logger.debug(f"Workflow already active, image config changed: {image_changed}")
+                try:
+                    if image_changed and not await self.post_image_config(image_config):
+                        return False
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"Client error in update_all: {e!r}")
+                    return False
+                return True
+
+        if current_config is None:
+            current_config = await self.get_current_config()
         if self.valves.enable_debug:
             logger.debug(f"current_config: {current_config}")
         if not current_config:
             logger.error("Failed to get current configuration")
             return False
 
+        if routed and backends[0].base_url is None and primary_key not in _PRIMARY_BASE_URLS:
+            stored = (current_config["comfyui"].get("COMFYUI_BASE_URL") or "").rstrip("/")
+            # Unless it already points at a secondary, what Open WebUI uses now is the primary.
+            if stored and stored not in (backend.base_url for backend in backends[1:]):
+                _PRIMARY_BASE_URLS[primary_key] = stored
+                comfyui_base_url = comfyui_base_url or stored
+        if routed and comfyui_base_url is None:
+            logger.error("Open WebUI points at another ComfyUI server and the primary's address is unknown")
+            return "Open WebUI uses another ComfyUI server; set `ComfyUI URL` as `url|owui_url` to switch back."
+
         # [IDEA] Could we grab the url to the generated image and add it to the body as a link? 
         # Update the config object
 
+        comfyui_before = self.config_digest(self.workflow_section(current_config["comfyui"]))
         current_config["comfyui"].update({
-            "COMFYUI_BASE_URL": current_config["comfyui"].get("COMFYUI_BASE_URL", "http://host.docker.internal:8188"),
+            "COMFYUI_BASE_URL": comfyui_base_url or current_config["comfyui"].get("COMFYUI_BASE_URL", "http://host.docker.internal:8188"),
             "COMFYUI_API_KEY": current_config["comfyui"].get("COMFYUI_API_KEY", ""),
-            "COMFYUI_WORKFLOW": workflow_data['data']['content'],
-            "COMFYUI_WORKFLOW_NODES": [
-                {
-                    "type": "prompt",
-                    "key": "text",
-                    "node_ids": [parsed_workflow_data["prompt"]["node_id"]],
-                },
-                {
-                    "type": "model",
-                    "key": "ckpt_name",
-                    "node_ids": [parsed_workflow_data["model"]["node_id"]],
-                },
-                {
-                    "type": "width",
-                    "key": "width",
-                    "node_ids": [parsed_workflow_data["width"]["node_id"]],
-                },
-                {
-                    "type": "height",
-                    "key": "height",
-                    "node_ids": [parsed_workflow_data["height"]["node_id"]],
-                },
-                {
-                    "type": "steps",
-                    "key": "steps",
-                    "node_ids": [parsed_workflow_data["steps"]["node_id"]],
-                },
-                {
-                    "type": "seed",
-                    "key": "noise_seed",
-                    "node_ids": [parsed_workflow_data["seed"]["node_id"]],
-                },
-            ],
+            "COMFYUI_WORKFLOW": self.get_workflow_content(parsed),
+            "COMFYUI_WORKFLOW_NODES": workflow_nodes,
         })
 
+        # Only post the sections that differ from what the server already has.
+        comfyui_after = self.config_digest(self.workflow_section(current_config["comfyui"]))
+        comfyui_changed = comfyui_before != comfyui_after
+        if self.valves.enable_debug:
+            logger.debug(f"image config changed: {image_changed}, workflow changed: {comfyui_changed}")
+
         # Try the update.    
         try:
-            async with aiohttp.ClientSession() as session:        
-                image_config_url = f"{self.valves.api_base_url}/api/v1/images/image/config/update"
-                async with session.post(
-                    image_config_url, json=image_config, headers=self.get_auth_headers()
-                ) as response:
-                    if response.status != 200:
-                        error_message = await response.text()
-                        logger.error(f"Error updating user image settings (status: {response.status}): {error_message}") 
-                        return False
+            if image_changed and not await self.post_image_config(image_config):
+                return False
 
-                # Image config updated, now comyui workflow etc.
+            # Image config updated, now comyui workflow etc.
+            if comfyui_changed:
                 config_url = f"{self.valves.api_base_url}/api/v1/images/config/update"
-                async with session.post(
-                    config_url, json=current_config, headers=self.get_auth_headers()
+                async with http_request(
+                    "POST",
+                    config_url,
+                    json=current_config,
+                    headers=self.get_auth_headers(),
+                    timeout=self.get_timeout(),
+                    span="config update",
                 ) as response:
                     if response.status != 200:
                         error_message = await response.text()
                         logger.error(f"Error updating main configuration (status: {response.status}): {error_message}")
                         return False
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Client error in update_all: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Client error in update_all: {e!r}")
             return False
+        _APPLIED_WORKFLOWS[self.valves.api_base_url] = AppliedWorkflow(
+            workflow_data.get("id"), current_config["comfyui"]["COMFYUI_BASE_URL"], comfyui_after
+        )
         # All done, will use pass as seen in other action scripts. [edit: nah, vscode cries.]
         return True           
 
+    async def post_image_config(self, image_config: Dict[str, Any]) -> bool:
+        """Posts the image config (model, size, steps), returns whether it was accepted."""
+        image_config_url = f"{self.valves.api_base_url}/api/v1/images/image/config/update"
+        async with http_request(
+            "POST",
+            image_config_url,
+            json=image_config,
+            headers=self.get_auth_headers(),
+            timeout=self.get_timeout(),
+            span="image config update",
+        ) as response:
+            if response.status != 200:
+                error_message = await response.text()
+                logger.error(f"Error updating user image settings (status: {response.status}): {error_message}") 
+                return False
+        return True
+
+    def get_workflow_content(self, parsed: CachedWorkflow) -> str:
+        """
+        Returns the workflow JSON to store in COMFYUI_WORKFLOW.
+
+        With `compact_workflow` on, nodes are reduced to EXECUTABLE_NODE_FIELDS and
+        the JSON is minified; the result is cached on the parsed workflow.
+        """
+        content = parsed.workflow_data['data']['content']
+        if not self.valves.compact_workflow:
+            return content
+        if parsed.compact_content is None:
+            parsed.compact_content = self.compact_workflow_content(content)
+            if self.valves.enable_debug:
+                logger.debug(f"Compacted workflow from {len(content)} to {len(parsed.compact_content)} chars")
+        return parsed.compact_content
+
+    def compact_workflow_content(self, content: Union[str, Dict[str, Any]]) -> str:
+        """
+        Minifies workflow JSON and drops the fields ComfyUI does not execute.
+
+        Args:
+            content: Workflow nodes as JSON text or a dict
+
+        Returns:
+            str: Minified JSON with only EXECUTABLE_NODE_FIELDS per node
+        """
+        with trace_span("compact"):
+            nodes = json.loads(content) if isinstance(content, str) else content
+            compact = {
+                node_id: {field: node[field] for field in EXECUTABLE_NODE_FIELDS if field in node}
+                for node_id, node in nodes.items()
+                if isinstance(node, dict)
+            }
+            return json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+
+    def image_section(self, image_config: dict) -> dict:
+        """The image config fields the loader sets, normalised for comparison."""
+        return {key: str(image_config.get(key, "")) for key in ("MODEL", "IMAGE_SIZE", "IMAGE_STEPS")}
+
+    def workflow_section(self, comfyui_config: dict) -> dict:
+        """The ComfyUI config fields the loader sets."""
+        return {
+            "COMFYUI_BASE_URL": comfyui_config.get("COMFYUI_BASE_URL", ""),
+            "COMFYUI_WORKFLOW": comfyui_config.get("COMFYUI_WORKFLOW", ""),
+            "COMFYUI_WORKFLOW_NODES": comfyui_config.get("COMFYUI_WORKFLOW_NODES", []),
+        }
+
+    def config_digest(self, section: Any) -> str:
+        """Content hash of a config section."""
+        encoded = json.dumps(section, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
     def has_required_node(self, node_title: str) -> bool:
         """
         Checks if a required node exists.
@@ -304,34 +1557,91 @@ class Action:
     # Unload models, update messages.
 
     async def unload_models(self) -> bool:
+        """Unloads the models on every configured ComfyUI server."""
+        backends = self.get_backends()
+        results = await asyncio.gather(*(self.free_models(backend.url) for backend in backends))
+        if len(backends) == 1:
+            message = results[0][1]
+        else:
+            message = "; ".join(f"{backend.label}: {text}" for backend, (_, text) in zip(backends, results))
+        await self.emit_event(message, True)
+        return all(ok for ok, _ in results)
+
+    async def apply_unload_policy(self, backends: List[ComfyBackend]) -> None:
+        """Unloads models on the sampled servers that the unload policy selects."""
+        for backend in backends:
+            telemetry = _TELEMETRY.backends.get(backend.url)
+            free_memory = self.unload_policy(backend, telemetry)
+            if free_memory is None:
+                continue
+            unloaded, message = await self.free_models(backend.url, free_memory)
+            logger.info(f"Automatic unload on {backend.label}: {message}")
+            if unloaded:
+                telemetry.auto_unloaded_at = time.monotonic()
+
+    def unload_policy(self, backend: ComfyBackend, telemetry: Optional[BackendTelemetry]) -> Optional[bool]:
+        """
+        Decides whether a server's models should be unloaded automatically.
+
+        Only servers with an empty queue are considered, and only once per
+        period of activity, so a server that stays low on VRAM because of
+        something else is not asked over and over.
+
+        Returns:
+            Optional[bool]: None to leave the server alone, otherwise the `free_memory`
+                            flag for /free (True when idle, as nothing needs the cache)
+        """
+        if telemetry is None or not backend.available or backend.queue_depth:
+            return None
+        if telemetry.auto_unloaded_at >= telemetry.last_busy:
+            return None
+
+        idle_after = self.valves.auto_unload_idle_minutes * 60
+        if idle_after > 0 and time.monotonic() - telemetry.last_busy >= idle_after:
+            return True
+        min_free = self.valves.auto_unload_free_vram_gb * 1024**3
+        if min_free > 0 and any(device.get("vram_free", 0) < min_free for device in backend.devices):
+            return False
+        return None
+
+    async def free_models(self, comfyui_url: str, free_memory: bool = False) -> Tuple[bool, str]:
+        """
+        Asks one ComfyUI server to unload its models.
+
+        Args:
+            comfyui_url (str): Server to unload
+            free_memory (bool): Also release ComfyUI's cached memory
+
+        Returns:
+            Tuple[bool, str]: Whether it worked (a server that is not running counts) and a status message
+        """
+        import aiohttp
         try:
             # First check if ComfyUI is running
-            if not await self.get_comfyui_stats():
-                await self.emit_event("ComfyUI is not running or not accessible", True)
-                return True
+            if not await self.get_comfyui_stats(comfyui_url):
+                return True, "ComfyUI is not running or not accessible"
 
             payload = {
                 "unload_models": True,
-                "free_memory": False
+                "free_memory": free_memory
             }
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.valves.comfyui_url}/free",
-                    json=payload
-                ) as response:
-                    if response.status == 200:
-                        await self.emit_event("Models unloaded successfully", True)
-                        return True
-                    else:
-                        await self.emit_event(f"Failed to unload models: {await response.text()}", True)
-                        if self.valves.enable_debug:
-                            logger.error(traceback.format_exc())
-                        return False
+            async with http_request(
+                "POST",
+                f"{comfyui_url}/free",
+                json=payload,
+                timeout=self.get_timeout(),
+                span="free",
+            ) as response:
+                if response.status == 200:
+                    return True, "Models unloaded successfully"
+                else:
+                    if self.valves.enable_debug:
+                        logger.error(traceback.format_exc())
+                    return False, f"Failed to unload models: {await response.text()}"
 
-        except aiohttp.ClientError as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Error unloading models: {str(e)}")
-            await self.emit_event(f"Error unloading models: {str(e)}", True)
-            return False
+            return False, f"Error unloading models: {str(e)}"
 
     # Re-usable event emitter.
     # await self.emit_event("message", True/False - false is spinner.)
@@ -361,13 +1671,19 @@ class Action:
         """
         url = f"{self.valves.api_base_url}/api/v1/files/{id}"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.get_auth_headers()) as response:
-                    if response.status != 200:
-                        logger.error(f"Error fetching workflow: {await response.text()}")
-                        return None
-                    workflow = await response.json()
-                    return workflow
+            async with http_request(
+                "GET",
+                url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="file",
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error fetching workflow: {await response.text()}")
+                    return None
+                workflow = await response.json()
+                return workflow
         except Exception as e:
             logger.error(f"Exception in get_workflows: {e}")
             return None
@@ -385,17 +1701,88 @@ class Action:
         """
         url = f"{self.valves.api_base_url}/api/v1/knowledge/{kb_id}"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.get_auth_headers()) as response:
-                    if response.status != 200:
-                        logger.error(f"Error fetching workflows: {await response.text()}")
-                        return None
-                    workflows = await response.json()
-                    return workflows
+            async with http_request(
+                "GET",
+                url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="kb list",
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error fetching workflows: {await response.text()}")
+                    return None
+                workflows = await response.json()
+                return workflows
         except Exception as e:
             logger.error(f"Exception in get_workflows: {e}")
             return None
 
+    # Cached workflow listing
+    async def get_listing(self, kb_id: str, force: bool = False) -> Optional[KnowledgeListing]:
+        """
+        Returns the workflow listing for a knowledge base, using the cache when possible.
+
+        A listing younger than `listing_cache_ttl` is returned without a request.
+        Older listings are revalidated with a conditional GET, and the name map is
+        only rebuilt when the KB's `updated_at` changed. A stale listing is
+        returned if the revalidation fails.
+
+        Args:
+            kb_id (str): Knowledge base identifier
+            force (bool): Revalidate even if the listing is still fresh
+
+        Returns:
+            Optional[KnowledgeListing]: The listing, None if it could not be fetched
+        """
+        key = (self.valves.api_base_url, kb_id)
+        cached = _LISTING_CACHE.get(key)
+        if cached and not force and cached.is_fresh(self.valves.listing_cache_ttl):
+            return cached
+
+        url = f"{self.valves.api_base_url}/api/v1/knowledge/{kb_id}"
+        headers = self.get_auth_headers()
+        if cached:
+            headers.update(cached.conditional_headers())
+        try:
+            async with http_request(
+                "GET",
+                url,
+                headers=headers,
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="kb list",
+            ) as response:
+                if response.status == 304 and cached:
+                    cached.touch()
+                    return cached
+                if response.status != 200:
+                    logger.error(f"Error fetching workflows: {await response.text()}")
+                    return cached
+                workflows = await response.json()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except Exception as e:
+            logger.error(f"Exception in get_listing: {e!r}")
+            return cached
+
+        updated_at = workflows.get("updated_at") if isinstance(workflows, dict) else None
+        if cached and updated_at is not None and updated_at == cached.updated_at:
+            cached.touch(etag, last_modified)
+            return cached
+
+        listing = KnowledgeListing(
+            self.get_file_names(workflows),
+            updated_at,
+            etag,
+            last_modified,
+            self.get_file_versions(workflows),
+        )
+        if cached:
+            listing.inherit_validation(cached)
+        _LISTING_CACHE[key] = listing
+        return listing
+
     # Auth
     def get_auth_headers(self) -> dict:
         """Returns authentication headers for API requests."""
@@ -405,44 +1792,197 @@ class Action:
             "Content-Type": "application/json",
         }
 
-    # Get comfy running status / vram usage. [todo] Update url to use valves.
-    async def get_comfyui_stats(self) -> Optional[dict]:
+    def get_timeout(self, total: Optional[float] = None):
+        """Returns the per-request timeout configured in the valves, or `total` seconds for faster endpoints."""
+        import aiohttp
+
+        return aiohttp.ClientTimeout(
+            total=total or self.valves.request_timeout, sock_connect=self.valves.connect_timeout
+        )
+
+    # ComfyUI servers.
+    def get_backends(self) -> List[ComfyBackend]:
+        """
+        Returns `comfyui_url` followed by any additional servers from the valves.
+
+        Entries are `url` or `url|owui_url`. Without an Open WebUI address the
+        primary server keeps whatever COMFYUI_BASE_URL is configured, while
+        additional servers are announced under their own url.
+        """
+        url, _, base_url = self.valves.comfyui_url.strip().partition("|")
+        backends = [ComfyBackend(url.strip(), base_url.strip() or None)]
+        for entry in self.valves.comfyui_backends.split(","):
+            url, _, base_url = entry.strip().partition("|")
+            if url.strip() and url.strip().rstrip("/") not in (b.url for b in backends):
+                backends.append(ComfyBackend(url.strip(), base_url.strip() or url.strip()))
+        return backends
+
+    async def poll_backends(self, backends: List[ComfyBackend], queue: bool = True) -> List[ComfyBackend]:
+        """
+        Fetches system stats (and queue depth) of all servers concurrently.
+
+        Args:
+            backends (List[ComfyBackend]): Servers to poll, updated in place
+            queue (bool): Also fetch the queue depth
+
+        Returns:
+            List[ComfyBackend]: The same servers
+        """
+        requests = [self.get_comfyui_stats(backend.url) for backend in backends]
+        if queue:
+            requests += [self.get_comfyui_queue(backend.url) for backend in backends]
+        results = await asyncio.gather(*requests)
+        for index, backend in enumerate(backends):
+            backend.stats = results[index]
+            if queue:
+                backend.queue_depth = results[len(backends) + index]
+        return backends
+
+    def select_backend(self, backends: List[ComfyBackend]) -> Optional[ComfyBackend]:
+        """
+        Picks the server to load a workflow on.
+
+        The shortest queue wins since queued jobs delay the first image the
+        most, ties go to the server with the most free VRAM.
+        """
+        available = [backend for backend in backends if backend.available]
+        if not available:
+            return None
+        return min(available, key=lambda backend: (backend.queue_depth, -backend.vram_free))
+
+    async def route_backend(self) -> Optional[ComfyBackend]:
+        """
+        Chooses a ComfyUI server when several are configured.
+
+        Returns:
+            Optional[ComfyBackend]: The chosen server, None with a single server
+                                    or when none of them answered
+        """
+        backends = self.get_backends()
+        if len(backends) < 2:
+            return None
+        backend = self.select_backend(await self.poll_backends(backends))
+        if backend is None:
+            logger.error("No ComfyUI server reachable, keeping the current one")
+        elif self.valves.enable_debug:
+            logger.debug(
+                "Backends: "
+                + ", ".join(f"{b.label} queue={b.queue_depth} free={b.vram_free}" for b in backends)
+                + f" -> {backend.label}"
+            )
+        return backend
+
+    async def get_comfyui_queue(self, comfyui_url: str) -> Optional[int]:
+        """
+        Gets the number of running and pending prompts on a ComfyUI server.
+
+        Returns:
+            Optional[int]: Queue depth, None if the request fails
+        """
+        import aiohttp
+        try:
+            async with http_request(
+                "GET",
+                f"{comfyui_url}/queue",
+                timeout=self.get_timeout(self.valves.status_timeout),
+                retries=self.valves.http_retries,
+                span="queue",
+            ) as response:
+                if response.status == 200:
+                    queue = await response.json()
+                    return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Error getting ComfyUI queue: {str(e)}")
+        return None
+
+    def telemetry_wanted(self) -> bool:
+        """True if background sampling is on and the VRAM display or an automatic unload uses it."""
+        return self.valves.telemetry_interval > 0 and (
+            self.valves.show_vram
+            or self.valves.auto_unload_free_vram_gb > 0
+            or self.valves.auto_unload_idle_minutes > 0
+        )
+
+    async def get_vram_snapshot(self) -> List[ComfyBackend]:
+        """
+        Returns the servers filled with their latest VRAM and queue sample.
+
+        Background samples are used while they are recent, otherwise (first
+        click, or telemetry disabled) the servers are polled right away.
+        """
+        backends = self.get_backends()
+        interval = self.valves.telemetry_interval
+        if interval > 0 and _TELEMETRY.fill(backends, max_age=2 * interval):
+            return backends
+        return await _TELEMETRY.poll(self, backends)
+
+    # Get comfy running status / vram usage.
+    async def get_comfyui_stats(self, comfyui_url: Optional[str] = None) -> Optional[dict]:
         """
         Gets ComfyUI system statistics including VRAM usage.
 
+        Args:
+            comfyui_url (Optional[str]): Server to ask, defaults to `comfyui_url` from the valves
+
         Returns:
             Optional[Dict]: Dictionary containing system stats if successful,
                            None if the request fails
         """
+        import aiohttp
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.valves.comfyui_url}/system_stats",) as response:
-                    if response.status == 200:
-                        return await response.json()
-        except aiohttp.ClientError as e:
+            async with http_request(
+                "GET",
+                f"{comfyui_url or self.get_backends()[0].url}/system_stats",
+                timeout=self.get_timeout(self.valves.status_timeout),
+                retries=self.valves.http_retries,
+                span="stats",
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error getting ComfyUI stats (status: {response.status}): {await response.text()}")
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
             logger.error(f"Error getting ComfyUI stats: {str(e)}")
             return None
 
     # Format stats for display.
-    def format_vram_info(self, stats: dict) -> str:
+    def format_vram_info(self, backends: List[ComfyBackend]) -> str:
         """
-        Formats VRAM information from system stats into a human-readable string.
+        Formats VRAM information of every device on every server into a human-readable string.
 
         Args:
-            stats (Dict): System stats dictionary from ComfyUI
+            backends (List[ComfyBackend]): Polled ComfyUI servers
 
         Returns:
             str: Formatted VRAM information string
         """
         try:
-            if not stats or "devices" not in stats or not stats["devices"]:
+            if not any(backend.devices for backend in backends):
                 return "VRAM info unavailable"
 
-            device = stats["devices"][0]  # Get first CUDA device
-            vram_total = device["vram_total"] / (1024**3)  # Convert to GB
-            vram_free = device["vram_free"] / (1024**3)  # Convert to GB
-            vram_used = vram_total - vram_free
-            return f"VRAM: {vram_used:.1f}/{vram_total:.1f} GB used"
+            # (name, "used/total", " [min-max trend]") per device.
+            entries: List[Tuple[str, str, str]] = []
+            for backend in backends:
+                if not backend.devices:
+                    entries.append((backend.label, "unavailable", ""))
+                telemetry = _TELEMETRY.backends.get(backend.url)
+                for index, device in enumerate(backend.devices):
+                    vram_total = device["vram_total"] / (1024**3)  # Convert to GB
+                    vram_free = device["vram_free"] / (1024**3)  # Convert to GB
+                    vram_used = vram_total - vram_free
+                    name = backend.label if len(backend.devices) == 1 else f"{backend.label}#{index}"
+                    history = telemetry.vram_used_range(index) if telemetry else None
+                    recent = ""
+                    if history and history[1] - history[0] >= 0.1 * 1024**3:
+                        low, high, change = (value / (1024**3) for value in history)
+                        trend = "↑" if change > 0.5 else "↓" if change < -0.5 else "→"
+                        recent = f" [{low:.1f}-{high:.1f}{trend}]"
+                    entries.append((name, f"{vram_used:.1f}/{vram_total:.1f}", recent))
+
+            if len(entries) == 1:
+                _, usage, recent = entries[0]
+                return f"VRAM: {usage} GB used{recent}"
+            return f"VRAM (GB used): {', '.join(f'{name} {usage}{recent}' for name, usage, recent in entries)}"
 
         except Exception as e:
             logger.error(f"Error formatting VRAM info: {e}")
@@ -461,18 +2001,52 @@ class Action:
             aiohttp.ClientError: Network request failure
             json.JSONDecodeError: Invalid JSON response
         """
+        import aiohttp
         config_url = f"{self.valves.api_base_url}/api/v1/images/config"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(config_url, headers=self.get_auth_headers()) as response:
-                    if response.status != 200:
-                        logger.error(f"Error fetching current config: {await response.text()}")
-                        return None
-                    return await response.json()
-        except aiohttp.ClientError as e:
+            async with http_request(
+                "GET",
+                config_url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="config",
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error fetching current config: {await response.text()}")
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Exception in get_current_config: {str(e)}")
             return None
 
+    # Get current image settings (model, size, steps) for comparison.
+    async def get_current_image_config(self) -> Optional[dict]:
+        """
+        Retrieves the current image generation settings from the API.
+
+        Returns:
+            Optional[dict]: MODEL, IMAGE_SIZE and IMAGE_STEPS if successful, None otherwise
+        """
+        import aiohttp
+        config_url = f"{self.valves.api_base_url}/api/v1/images/image/config"
+        try:
+            async with http_request(
+                "GET",
+                config_url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="image config",
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"Error fetching current image config: {await response.text()}")
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Exception in get_current_image_config: {e!r}")
+            return None
+
     # Get filenames, and ids.:
     def get_file_names(self, workflows: Optional[dict]) -> dict:
         """Extracts base filenames and their IDs from workflow files."""
@@ -490,17 +2064,56 @@ class Action:
                 continue
         return filename_map
 
+    def get_file_versions(self, workflows: Optional[dict]) -> Dict[str, Any]:
+        """Maps file ids to their content hash (or updated_at) from the KB listing."""
+        if not workflows:
+            return {}
+
+        versions = {}
+        for file in workflows.get('files', []):
+            try:
+                version = file.get("hash") or file.get("updated_at")
+                if version is not None:
+                    versions[file["id"]] = version
+            except (AttributeError, KeyError, TypeError):
+                continue
+        return versions
+
 
 class WorkflowParser:
     """
     A dedicated parser for ComfyUI workflow data that handles the complexity of
     nested JSON structures and provides a clean interface for extracting configuration data.
+
+    Extraction is driven by NODE_EXTRACTION_PLAN, compiled once into a lookup
+    keyed by lowercase node title. The node graph is walked a single time and
+    the walk stops as soon as every required node has been found.
     """
 
+    _compiled_plan: Dict[str, tuple] = {}
+
     def __init__(self) -> None:
         """Initialize the parser with default required nodes."""
-        self.required_nodes: List[str] = REQUIRED_NODES
+        self.required_nodes: List[str] = list(REQUIRED_NODES)
         self.img_config: Dict[str, Any] = {}
+        if not WorkflowParser._compiled_plan:
+            WorkflowParser._compiled_plan = self.compile_plan(NODE_EXTRACTION_PLAN)
+
+    @staticmethod
+    def compile_plan(plan: Dict[str, List[tuple]]) -> Dict[str, tuple]:
+        """
+        Compiles an extraction plan into a lookup keyed by lowercase title.
+
+        Args:
+            plan: Node title -> list of (config key, accepted input names)
+
+        Returns:
+            Dictionary of lowercase title -> (title, extraction specs)
+        """
+        return {
+            title.lower(): (title, tuple((key, tuple(inputs)) for key, inputs in specs))
+            for title, specs in plan.items()
+        }
 
     def parse(self, data: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -511,23 +2124,33 @@ class WorkflowParser:
                  Can be the full document or just the workflow content
 
         Returns:
-            Dictionary containing extracted configuration values
+            Dictionary containing extracted configuration values, each as
+            {'value': ..., 'node_id': ..., 'key': <input name it was read from>}
         """
         self.img_config = {}
-        # Reset required nodes for new parsing
-        self.required_nodes = ['model', 'positive_prompt', 'dimensions', 'seed', 'scheduler']
+        # Required nodes still to be found, removed as they are processed.
+        pending: Dict[str, tuple] = dict(self._compiled_plan)
 
-        # Extract the actual workflow content (nodes)
-        workflow_nodes = self._extract_workflow_nodes(data)
+        # Extract the actual workflow content (nodes), lazily for large JSON strings
+        workflow_nodes = self._iter_workflow_nodes(data)
+        remaining = iter(workflow_nodes)
 
         # Process each node
-        for node_id, node in workflow_nodes.items():
-            if self._is_required_node(node):
-                self._process_node(node, node_id)
-                # Remove from required list
-                if node["_meta"]["title"] in self.required_nodes:
-                    self.required_nodes.remove(node["_meta"]["title"])
-
+        for node_id, node in remaining:
+            title = self._node_title(node)
+            if title is None:
+                continue
+            entry = pending.get(title.lower())
+            if entry is not None and self._process_node(node, node_id, entry[1]):
+                del pending[title.lower()]
+                if not pending:
+                    break
+        if remaining is workflow_nodes:
+            # A stream: decode whatever is left, so a malformed tail is still rejected.
+            for _ in remaining:
+                pass
+
+        self.required_nodes = [title for title, _ in pending.values()]
         return self.img_config
 
     def _extract_workflow_nodes(self, data: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
@@ -568,42 +2191,110 @@ class WorkflowParser:
         # If we get here, we couldn't identify the structure
         raise ValueError("Could not extract workflow nodes from provided data")
 
-    def _is_required_node(self, node: Dict[str, Any]) -> bool:
-        """Check if a node is one of the required types."""
-        if '_meta' not in node or 'title' not in node['_meta']:
+    def _iter_workflow_nodes(self, data: Union[str, Dict[str, Any]]) -> Iterable[Tuple[str, Any]]:
+        """
+        Return the (node_id, node) pairs of the workflow.
+
+        Large `data.content` strings (see STREAM_MIN_CHARS) come back as an
+        iterator that decodes one node at a time, so each node can be released
+        once it has been checked, and which only finishes validating the
+        content once exhausted. Smaller ones and other formats are decoded
+        whole by _extract_workflow_nodes.
+        """
+        content = None
+        if isinstance(data, dict) and isinstance(data.get('data'), dict):
+            content = data['data'].get('content')
+        if isinstance(content, str) and len(content) >= STREAM_MIN_CHARS:
+            return self._stream_nodes(content)
+
+        nodes = self._extract_workflow_nodes(data)
+        if not isinstance(nodes, dict):
+            raise ValueError("Workflow content is not a JSON object")
+        return nodes.items()
+
+    @staticmethod
+    def _stream_nodes(content: str) -> Iterator[Tuple[str, Any]]:
+        """
+        Decode a JSON object of nodes one member at a time.
+
+        Args:
+            content: JSON object text, node id -> node
+
+        Raises:
+            ValueError: If the content is not a single JSON object
+        """
+        try:
+            yield from WorkflowParser._decode_members(content)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON in data.content: {e}")
+
+    @staticmethod
+    def _decode_members(content: str) -> Iterator[Tuple[str, Any]]:
+        """Yield the members of the JSON object `content`, rejecting anything after it."""
+        skip = _JSON_WHITESPACE.match
+        idx = skip(content, 0).end()
+        if content[idx:idx + 1] != '{':
+            raise ValueError("Workflow content is not a JSON object")
+        idx = skip(content, idx + 1).end()
+
+        while content[idx:idx + 1] != '}':
+            node_id, idx = _JSON_DECODER.raw_decode(content, idx)
+            idx = skip(content, idx).end()
+            if not isinstance(node_id, str) or content[idx:idx + 1] != ':':
+                raise ValueError(f"Expected a node id at position {idx}")
+            node, idx = _JSON_DECODER.raw_decode(content, skip(content, idx + 1).end())
+            yield node_id, node
+
+            idx = skip(content, idx).end()
+            separator = content[idx:idx + 1]
+            if separator == '}':
+                break
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' at position {idx}")
+            idx = skip(content, idx + 1).end()
+            if content[idx:idx + 1] == '}':
+                raise ValueError(f"Trailing ',' before position {idx}")
+
+        idx = skip(content, idx + 1).end()
+        if idx != len(content):
+            raise ValueError(f"Extra data at position {idx}")
+
+    def _node_title(self, node: Any) -> Optional[str]:
+        """Return the node's `_meta.title`, or None if it has none."""
+        if not isinstance(node, dict):
+            return None
+        meta = node.get('_meta')
+        if not isinstance(meta, dict):
+            return None
+        title = meta.get('title')
+        return title if isinstance(title, str) else None
+
+    def _process_node(self, node: Dict[str, Any], node_id: str, specs: tuple) -> bool:
+        """
+        Extract relevant configuration from a node.
+
+        Returns:
+            True if every value in `specs` was found, False if the node lacks
+            one (it is then left as missing).
+        """
+        inputs = node.get('inputs')
+        if not isinstance(inputs, dict):
             return False
 
-        title = node['_meta']['title']
-        return title.lower() in [n.lower() for n in self.required_nodes]
-
-    def _process_node(self, node: Dict[str, Any], node_id: str) -> None:
-        """Extract relevant configuration from a node."""
-        title = node["_meta"]["title"]
-
-        match title.lower():
-            case 'model':
-                self.img_config.update({'model': {
-                    'value': node['inputs']['unet_name'],
-                    'node_id': node_id}})
-            case 'positive_prompt':
-                self.img_config.update({'prompt': {
-                    'value': node['inputs']['text'],
-                    'node_id': node_id}})
-            case 'dimensions':
-                self.img_config.update({'width': {
-                    'value': node['inputs']['width'],
-                    'node_id': node_id}})
-                self.img_config.update({'height': {
-                    'value': node['inputs']['height'],
-                    'node_id': node_id}})
-            case 'seed':
-                self.img_config.update({'seed': {
-                    'value': node['inputs']['noise_seed'],
-                    'node_id': node_id}})
-            case 'scheduler':
-                self.img_config.update({'steps': {
-                    'value': node['inputs']['steps'],
-                    'node_id': node_id}})
+        extracted = {}
+        for config_key, input_names in specs:
+            for input_name in input_names:
+                if input_name in inputs:
+                    extracted[config_key] = {
+                        'value': inputs[input_name],
+                        'node_id': node_id,
+                        'key': input_name,
+                    }
+                    break
+            else:
+                return False
+        self.img_config.update(extracted)
+        return True
 
     def is_complete(self) -> bool:
         """Check if all required nodes were found."""
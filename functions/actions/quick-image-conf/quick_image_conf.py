@@ -9,10 +9,639 @@ icon_url: data:image/svg+xml,%3C%3Fxml%20version%3D%221.0%22%20encoding%3D%22utf
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-import aiohttp
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterator, List, Tuple
+from collections import OrderedDict
 import asyncio
+import bisect
+import contextlib
+import contextvars
+import difflib
+import functools
+import json
+import random
 import re
+import sys
+import time
+import types
+from urllib.parse import urlsplit
+
+_debug_log = print  # Sink for debug output such as trace spans.
+
+
+# Shared HTTP connection pool.
+# The pool, retry and tracing code down to `traced` is the same in every action,
+# byte for byte (bench/shared_code.py checks this).
+# Open WebUI loads every function as its own module, so the pool registry is kept
+# on a private entry in sys.modules where all of the actions can find it. There is
+# one ClientSession per event loop, which keeps connections to the Open WebUI API
+# and ComfyUI warm between clicks instead of handshaking on every request. The
+# session is closed when its loop shuts down its async generators, which
+# asyncio.run (and so uvicorn) does before closing the loop.
+_HTTP_POOL_MODULE = "_owui_actions_http_pool"
+HTTP_POOL_LIMIT: int = 100  # Connections across all hosts.
+HTTP_POOL_LIMIT_PER_HOST: int = 10
+HTTP_POOL_DNS_TTL: int = 300  # Seconds to cache DNS lookups.
+HTTP_POOL_KEEPALIVE: float = 60.0  # Seconds an idle connection is kept open.
+
+
+def _http_pool() -> types.ModuleType:
+    """Returns the process-wide pool registry, creating it on first use."""
+    pool = sys.modules.get(_HTTP_POOL_MODULE)
+    if pool is None:
+        pool = types.ModuleType(_HTTP_POOL_MODULE)
+        pool.sessions = {}
+        pool.closers = {}
+        sys.modules[_HTTP_POOL_MODULE] = pool
+    return pool
+
+
+def get_http_session():
+    """
+    Returns the pooled aiohttp ClientSession for the running event loop.
+
+    Sessions are created lazily, and replaced if the previous one was closed or
+    belonged to a loop that has since been closed. Callers must not close it.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    pool = _http_pool()
+    sessions: Dict[Any, Any] = pool.sessions
+    closers: Dict[Any, Any] = pool.__dict__.setdefault("closers", {})
+    for stale in [l for l in sessions if l.is_closed()]:
+        del sessions[stale]
+        closers.pop(stale, None)
+
+    session = sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_POOL_DNS_TTL,
+            keepalive_timeout=HTTP_POOL_KEEPALIVE,
+        )
+        # No cookie jar: the session is shared by actions with different tokens.
+        session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar()
+        )
+        sessions[loop] = session
+        # Held here because the loop only keeps a weak reference to it.
+        closers[loop] = _close_at_loop_shutdown(session)
+    return session
+
+
+async def close_http_session() -> None:
+    """Closes the pooled session for the running event loop, if there is one."""
+    session = _http_pool().sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _close_at_loop_shutdown(session: Any) -> Any:
+    """
+    Returns an async generator, parked at its yield, that closes `session`.
+
+    Starting it registers it with the running loop, whose shutdown_asyncgens()
+    then closes it while the loop can still await the session's close().
+    """
+
+    async def closer():
+        try:
+            yield
+        finally:
+            if not session.closed:
+                await session.close()
+
+    generator = closer()
+    try:
+        generator.asend(None).send(None)
+    except StopIteration:
+        pass  # Reached the yield.
+    return generator
+
+
+# Retries and circuit breaking for outbound requests.
+# Circuit state is kept per host on the shared pool registry, so once ComfyUI or
+# the Open WebUI API keeps failing, every action fails fast for a cool-down
+# instead of waiting out its timeout on each request.
+HTTP_RETRY_BASE_DELAY: float = 0.2  # Seconds, doubled per attempt, full jitter.
+HTTP_RETRY_MAX_DELAY: float = 2.0
+HTTP_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open a circuit.
+CIRCUIT_COOLDOWN: float = 30.0  # Seconds an open circuit fails fast.
+
+
+def _circuit(url: str) -> Dict[str, float]:
+    """Returns the circuit state of the host `url` points at."""
+    circuits = _http_pool().__dict__.setdefault("circuits", {})
+    return circuits.setdefault(urlsplit(url).netloc, {"failures": 0, "open_until": 0.0})
+
+
+def _record_outcome(circuit: Dict[str, float], ok: bool) -> None:
+    """Closes the circuit on success, opens it after too many failures in a row."""
+    if ok:
+        circuit["failures"] = 0
+        return
+    circuit["failures"] += 1
+    if circuit["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+        # Half-open after the cool-down: the next failure reopens it right away.
+        circuit["open_until"] = time.monotonic() + CIRCUIT_COOLDOWN
+
+
+@contextlib.asynccontextmanager
+async def http_request(
+    method: str, url: str, *, timeout: Any, retries: int = 0, span: Optional[str] = None, **kwargs: Any
+):
+    """
+    Sends a request on the pooled session and yields the response.
+
+    Connection errors, timeouts and 429/502/503/504 responses are retried up to
+    `retries` times with jittered exponential backoff (only pass retries for
+    idempotent requests). All attempts share the `timeout` budget, so a call
+    never takes longer than `timeout.total`. Requests to a host whose circuit
+    is open fail immediately with `aiohttp.ClientConnectionError`. The call is
+    recorded as a span named `span` when a trace is active.
+    """
+    import aiohttp
+
+    circuit = _circuit(url)
+    deadline = time.monotonic() + timeout.total if timeout.total else None
+    attempt = 0
+    started = time.perf_counter()
+    attempts = 0
+    response = None
+    status: Any = None
+    try:
+        while True:
+            if circuit["open_until"] > time.monotonic():
+                raise aiohttp.ClientConnectionError(f"Circuit open for {urlsplit(url).netloc}")
+            remaining = deadline - time.monotonic() if deadline else None
+            attempt_timeout = aiohttp.ClientTimeout(total=remaining, sock_connect=timeout.sock_connect)
+            attempts += 1
+            error: Optional[BaseException] = None
+            response = None
+            try:
+                response = await get_http_session().request(method, url, timeout=attempt_timeout, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if response is not None and response.status not in HTTP_RETRY_STATUSES:
+                _record_outcome(circuit, response.status < 500)
+                break
+            _record_outcome(circuit, False)
+
+            attempt += 1
+            delay = random.uniform(0, min(HTTP_RETRY_MAX_DELAY, HTTP_RETRY_BASE_DELAY * 2**attempt))
+            if attempt > retries or (deadline and time.monotonic() + delay >= deadline):
+                if response is None:
+                    raise error
+                break  # Out of attempts, hand back the last response.
+            if response is not None:
+                response.release()
+            await asyncio.sleep(delay)
+
+        status = response.status
+        yield response
+    except BaseException as e:
+        status = status or type(e).__name__
+        raise
+    finally:
+        if response is not None:
+            response.release()
+        _trace(
+            span or f"{method} {urlsplit(url).path}",
+            started,
+            status,
+            response.content_length if response is not None else None,
+            attempts,
+        )
+
+
+# Per-invocation tracing.
+# With `enable_debug` on, the action runs with a Tracer in `_TRACE`. Every
+# outbound request and parse step records a span into it, and the action emits
+# a one-line summary of them when it finishes. Background tasks clear it.
+_TRACE: "contextvars.ContextVar[Optional[Tracer]]" = contextvars.ContextVar("owui_action_trace", default=None)
+
+
+class Tracer:
+    """Spans (name, duration, status, bytes) recorded during one action invocation."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def record(
+        self, name: str, duration: float, status: Any = None, size: Optional[int] = None, attempts: int = 1
+    ) -> None:
+        self.spans.append(
+            {"name": name, "ms": round(duration * 1000, 1), "status": status, "bytes": size, "attempts": attempts}
+        )
+
+    def summary(self) -> str:
+        """Spans grouped by name, e.g. "kb list 42ms · file 118ms · config 2×31ms · total 210ms"."""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for span in self.spans:
+            groups.setdefault(span["name"], []).append(span)
+        parts = []
+        for name, spans in groups.items():
+            average = sum(span["ms"] for span in spans) / len(spans)
+            count = f"{len(spans)}×" if len(spans) > 1 else ""
+            failed = [str(span["status"]) for span in spans if span["status"] not in ("ok", 200, 304)]
+            parts.append(f"{name} {count}{average:.0f}ms" + (f" [{', '.join(failed)}]" if failed else ""))
+        parts.append(f"total {(time.perf_counter() - self.started) * 1000:.0f}ms")
+        return " · ".join(parts)
+
+
+def _trace(name: str, started: float, status: Any = None, size: Optional[int] = None, attempts: int = 1) -> None:
+    """Records a span that began at `started` (perf_counter) if a trace is active."""
+    tracer = _TRACE.get()
+    if tracer is not None:
+        tracer.record(name, time.perf_counter() - started, status, size, attempts)
+
+
+@contextlib.contextmanager
+def trace_span(name: str) -> Iterator[None]:
+    """Times the enclosed block as a span."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _trace(name, started, status)
+
+
+def traced(action: Callable) -> Callable:
+    """Wraps `Action.action` so debug runs are traced and end with a timing summary."""
+
+    @functools.wraps(action)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        if not self.valves.enable_debug:
+            return await action(self, *args, **kwargs)
+        tracer = Tracer()
+        token = _TRACE.set(tracer)
+        try:
+            return await action(self, *args, **kwargs)
+        finally:
+            _TRACE.reset(token)
+            _debug_log(json.dumps({"action": __name__, "spans": tracer.spans}))
+            emitter = kwargs.get("__event_emitter__")
+            if emitter:
+                await emitter({"type": "status", "data": {"description": f"⏱ {tracer.summary()}", "done": True}})
+
+    return wrapper
+
+
+# Coalesced read-modify-write updates.
+# Every update of a target (the image config, or one user's settings) goes
+# through its ConfigWriter. Only one batch per target is in flight at a time,
+# and changes submitted while a batch waits are merged into it, so a burst from
+# several tabs or admins becomes a single POST. A batch re-reads the target
+# under the lock and applies its changes to what the server holds at that
+# moment, not to what each caller saw when its modal opened. The endpoints
+# have no version or ETag to swap against, so this re-read is the compare step.
+UPDATE_COALESCE_WINDOW: float = 0.02  # Seconds a batch waits for more changes.
+
+Change = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class ConfigWriter:
+    """Serializes and batches the read-modify-write updates of one target."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending: List[Tuple[Change, bool, "asyncio.Future[Optional[Dict[str, Any]]]"]] = []
+
+    async def submit(
+        self,
+        change: Change,
+        expected: Dict[str, Any],
+        read: Callable[[], Any],
+        write: Callable[[Dict[str, Any], Dict[str, Any]], Any],
+        blind: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Applies a change to the target, together with any changes submitted meanwhile.
+
+        Args:
+            change (Change): Returns the updated document for a given one, without mutating it
+            expected (Dict[str, Any]): The document the caller last saw, used if the re-read fails
+            read (Callable): Coroutine function fetching the current document, None on failure
+            write (Callable): Coroutine function posting a document, given the one it was
+                              derived from so it can send only what changed; True on success
+            blind (bool): The change overwrites everything it depends on, so needs no re-read
+
+        Returns:
+            Optional[Dict[str, Any]]: The document that was written, None if the write failed
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((change, blind, future))
+        async with self.lock:
+            if future.done():
+                return future.result()  # An earlier batch took this change.
+            await asyncio.sleep(UPDATE_COALESCE_WINDOW)
+            batch, self.pending = self.pending, []
+            try:
+                result = await self._apply(batch, expected, read, write)
+            except BaseException:
+                # Hand the other callers' changes to the next batch.
+                self.pending[:0] = [entry for entry in batch if entry[2] is not future]
+                raise
+            for _, _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_result(result)
+        return future.result()
+
+    async def _apply(
+        self,
+        batch: List[Tuple[Change, bool, "asyncio.Future[Optional[Dict[str, Any]]]"]],
+        expected: Dict[str, Any],
+        read: Callable[[], Any],
+        write: Callable[[Dict[str, Any], Dict[str, Any]], Any],
+    ) -> Optional[Dict[str, Any]]:
+        """Re-reads the target unless every change is blind, applies the batch in order and posts it once."""
+        blind = all(entry[1] for entry in batch)
+        current = expected if blind else (await read() or expected)
+        document = current
+        for change, _, _ in batch:
+            document = change(document)
+        if document == current and not blind:
+            return document  # Already what the server holds.
+        return document if await write(document, current) else None
+
+
+_WRITERS: Dict[str, ConfigWriter] = {}
+
+
+# Command grammar.
+# Input is a run of space separated `key:value` commands. A value may be quoted
+# to hold spaces, with backslash escapes for quotes and backslashes inside.
+# Each action maps its keys to validators in a COMMANDS table; a validator
+# checks one value and writes the updates it stands for, or raises ValueError.
+# Tokens are plain `(text, key, value, quoted)` tuples, `text` being the
+# command as typed and `key` None for a token without a colon.
+_QUOTED_TOKEN_RE = re.compile(r'([^\s:"]*):"((?:[^"\\]|\\.)*)"(?!\S)|(\S+)')
+_ESCAPE_RE = re.compile(r"\\(.)")
+
+Token = Tuple[str, Optional[str], str, bool]
+Validator = Callable[[str, str, bool, Dict[str, Any]], None]
+
+
+@functools.lru_cache(maxsize=256)
+def tokenize(input_str: str) -> Tuple[Token, ...]:
+    """Splits input into commands with the precompiled scanner, unquoting quoted values."""
+    tokens: List[Token] = []
+    for match in _QUOTED_TOKEN_RE.finditer(input_str):
+        key, value, bare = match.groups()
+        if bare is not None:
+            key, colon, value = bare.partition(":")
+            tokens.append((bare, key.lower() if colon else None, value, False))
+        else:
+            if "\\" in value:
+                value = _ESCAPE_RE.sub(r"\1", value)
+            tokens.append((match.group(0), key.lower(), value, True))
+    return tuple(tokens)
+
+
+def parse_commands(input_str: str, commands: Dict[str, Validator]) -> Dict[str, Any]:
+    """
+    Parses every command in the input against a COMMANDS table.
+
+    Args:
+        input_str (str): User input, e.g. 'st:16 md:"SDXL 1.0"'
+        commands (Dict[str, Validator]): Lowercase key to validator
+
+    Returns:
+        Dict[str, Any]: The merged updates; a later command wins over an earlier one
+
+    Raises:
+        ValueError: If a command is unknown or its value is invalid
+    """
+    updates: Dict[str, Any] = {}
+    if '"' not in input_str:
+        # Nothing is quoted, so str.split tokenizes it without the scanner.
+        for text in input_str.split():
+            key, colon, value = text.partition(":")
+            validator = commands.get(key.lower()) if colon else None
+            if validator is None:
+                raise ValueError(f"Unknown command: {text}")
+            validator(text, value, False, updates)
+        return updates
+    for text, key, value, quoted in tokenize(input_str):
+        validator = commands.get(key)
+        if validator is None:
+            raise ValueError(f"Unknown command: {text}")
+        validator(text, value, quoted, updates)
+    return updates
+
+
+def integer(field: str, label: str, minimum: int = 1) -> Validator:
+    """Validates a whole number of at least `minimum`."""
+
+    def validate(text: str, value: str, quoted: bool, updates: Dict[str, Any]) -> None:
+        try:
+            number = int(value)
+        except ValueError:
+            number = minimum - 1
+        if number < minimum:
+            raise ValueError(f"Invalid {label}: {text}")
+        updates[field] = number
+
+    return validate
+
+
+def string(field: str, label: str, quoted: bool = False, lower: bool = False, required: bool = True) -> Validator:
+    """Validates a string value, quoted if `quoted` (optional otherwise) and non-empty if `required`."""
+    must_quote = quoted
+
+    def validate(text: str, value: str, quoted: bool, updates: Dict[str, Any]) -> None:
+        if must_quote and not quoted:
+            raise ValueError(f"{label} must be in quotes: {text}")
+        if required and not value and not quoted:
+            raise ValueError(f"Missing {label}: {text}")
+        updates[field] = value.lower() if lower else value
+
+    return validate
+
+
+def size(width_field: str, height_field: str, toggle_field: str, label: str) -> Validator:
+    """Validates `WxH` with positive whole numbers, or `tg` to swap them."""
+
+    def validate(text: str, value: str, quoted: bool, updates: Dict[str, Any]) -> None:
+        if value.lower() == "tg":
+            updates[toggle_field] = True
+            return
+        width, _, height = value.partition("x")
+        try:
+            width, height = int(width), int(height)
+        except ValueError:
+            width = height = 0
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Invalid {label}: {text}")
+        updates[width_field] = width
+        updates[height_field] = height
+
+    return validate
+
+
+COMMANDS: Dict[str, Validator] = {
+    "st": integer("steps", "steps format"),
+    "dm": size("width", "height", "toggle_dimensions", "dimensions format"),
+    "md": string("model", "Model name", quoted=True),
+    "p": string("preset", "preset name", lower=True),
+}
+
+
+# Last known image config, per Open WebUI server.
+# The modal is rendered from here so it opens without waiting on a GET. Every
+# write bumps the version, and a read only lands if no write happened while it
+# was in flight, so a slow GET can never roll the cache back.
+class CachedConfig:
+    """The last image config seen from one server, with a write counter."""
+
+    def __init__(self):
+        self.config: Optional[Dict[str, Any]] = None
+        self.version: int = 0
+        self.updated_at: float = 0.0
+        self.refresh_task: Optional["asyncio.Task"] = None
+
+    def refresh(self, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """Runs `fetch` in the background, unless a refresh is still in flight on this loop."""
+        task = self.refresh_task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return
+        self.refresh_task = asyncio.ensure_future(fetch())
+        # Retrieve the outcome so asyncio does not log it as unhandled.
+        self.refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def store(self, config: Dict[str, Any], read_at: Optional[int] = None) -> bool:
+        """
+        Replaces the cached config.
+
+        Args:
+            config (Dict[str, Any]): The config returned by the server
+            read_at (Optional[int]): Version seen when the read started, None for writes
+
+        Returns:
+            bool: False if a newer write landed while the read was in flight
+        """
+        if read_at is not None and read_at != self.version:
+            return False
+        self.config = dict(config)
+        self.version += 1
+        self.updated_at = time.monotonic()
+        return True
+
+
+_CONFIG_CACHE: Dict[str, CachedConfig] = {}
+
+
+# Image models offered by each server, for completing `md:` values.
+MODEL_PLACEHOLDER_LIMIT: int = 6  # Model names listed in the modal placeholder.
+
+
+class ModelCatalog:
+    """The image models of one server, indexed by id and name for completion."""
+
+    def __init__(self, models: List[Any]):
+        self.fetched_at = time.monotonic()
+        self.ids: List[str] = []
+        entries = set()
+        for model in models:
+            model_id = str(model.get("id", "")) if isinstance(model, dict) else str(model)
+            if not model_id:
+                continue
+            self.ids.append(model_id)
+            entries.add((model_id.lower(), model_id))
+            if isinstance(model, dict) and model.get("name"):
+                entries.add((str(model["name"]).lower(), model_id))
+        # Sorted lowercase keys, so every key with a given prefix is one slice.
+        self._entries: List[Tuple[str, str]] = sorted(entries)
+        self._keys: List[str] = [key for key, _ in self._entries]
+
+    def expired(self, ttl: float) -> bool:
+        """Returns True once the catalog is older than `ttl` seconds."""
+        return time.monotonic() - self.fetched_at > ttl
+
+    def matches(self, query: str) -> List[str]:
+        """
+        Finds the model ids a partial name could mean.
+
+        Args:
+            query (str): A full or partial model id or name, any case
+
+        Returns:
+            List[str]: The exact match alone if there is one, otherwise every
+                       model whose id or name starts with the query, or else
+                       contains it
+        """
+        key = query.strip().lower()
+        start = bisect.bisect_left(self._keys, key)
+        found: List[str] = []
+        for entry_key, model_id in self._entries[start:]:
+            if not entry_key.startswith(key):
+                break
+            if entry_key == key:
+                return [model_id]
+            found.append(model_id)
+        if not found:
+            found = [model_id for entry_key, model_id in self._entries if key in entry_key]
+        return sorted(set(found))
+
+    def resolve(self, query: str) -> str:
+        """
+        Completes a partial model name to the one model it identifies.
+
+        Args:
+            query (str): The value given to `md:`
+
+        Returns:
+            str: The full model id
+
+        Raises:
+            ValueError: If no model, or more than one, matches the query
+        """
+        found = self.matches(query)
+        if len(found) == 1:
+            return found[0]
+        if found:
+            raise ValueError(f"Model '{query}' is ambiguous: {', '.join(found[:MODEL_PLACEHOLDER_LIMIT])}")
+        close = difflib.get_close_matches(query.strip().lower(), self._keys, n=3, cutoff=0.5)
+        suggestions = sorted({model_id for key, model_id in self._entries if key in close})
+        hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+        raise ValueError(f"Unknown model '{query}'.{hint}")
+
+    def summary(self) -> str:
+        """Returns the model ids for the modal placeholder, shortened if there are many."""
+        shown = ", ".join(self.ids[:MODEL_PLACEHOLDER_LIMIT])
+        more = len(self.ids) - MODEL_PLACEHOLDER_LIMIT
+        return f"{shown} (+{more} more)" if more > 0 else shown
+
+
+_MODEL_CATALOG: Dict[str, ModelCatalog] = {}
+# The fetch in flight per server, shared by concurrent opens of the modal.
+_MODEL_CATALOG_FETCHES: Dict[str, "asyncio.Future"] = {}
+
+# Presets compiled to partial update payloads.
+IMAGE_CONFIG_FIELDS = ("MODEL", "IMAGE_SIZE", "IMAGE_STEPS")
+PRESET_CACHE_SIZE: int = 256  # Owners (the shared valve, then each user) kept compiled.
+
+
+class CompiledPresets:
+    """One owner's presets, compiled from their valve text against a model catalog."""
+
+    def __init__(self, spec: str, catalog: Optional[ModelCatalog]):
+        self.spec = spec
+        self.catalog = catalog
+        self.presets: Dict[str, Dict[str, Any]] = {}
+        self.rejected: Dict[str, str] = {}  # Preset name to the reason it was skipped.
+
+
+# Keyed by owner: "" for the shared valve, otherwise the user id. Only the latest
+# valve text of each owner is kept, least recently used owners are dropped first.
+_PRESETS: "OrderedDict[str, CompiledPresets]" = OrderedDict()
 
 
 class Action:
@@ -28,10 +657,44 @@ class Action:
         enable_debug: bool = Field(
             default=False, description="Enable debug output messages"
         )
+        request_timeout: float = Field(
+            default=30.0,
+            description="Seconds before an API request is abandoned",
+        )
+        connect_timeout: float = Field(
+            default=10.0,
+            description="Seconds allowed to open a new connection",
+        )
+        http_retries: int = Field(
+            default=2,
+            description="Extra attempts for a failed settings read, within the same timeout",
+        )
+        model_catalog_ttl: int = Field(
+            default=300,
+            description="Seconds the list of image models is cached for completing md: values",
+        )
+        presets: str = Field(
+            default="",
+            description='Named presets, separated by semicolons, applied with p:name. E.g. portrait-hq=md:"flux1-dev.safetensors" st:30 dm:832x1216',
+        )
+
+    class UserValves(BaseModel):
+        presets: str = Field(
+            default="",
+            description="Your own presets, in the same format. They take precedence over shared ones",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
 
+    def get_timeout(self, total: Optional[float] = None):
+        """Returns the per-request timeout configured in the valves, or `total` seconds for faster endpoints."""
+        import aiohttp
+
+        return aiohttp.ClientTimeout(
+            total=total or self.valves.request_timeout, sock_connect=self.valves.connect_timeout
+        )
+
     def get_auth_headers(self):
         """
         Generates authentication headers for API requests.
@@ -51,9 +714,13 @@ class Action:
             "Content-Type": "application/json",
         }
 
+    def config_cache(self) -> CachedConfig:
+        """Returns the cached image config for the configured server."""
+        return _CONFIG_CACHE.setdefault(self.valves.api_base_url, CachedConfig())
+
     async def get_current_config(self) -> Optional[Dict[str, Any]]:
         """
-        Retrieves the current image configuration from the API.
+        Retrieves the current image configuration from the API and caches it.
 
         Returns:
             Optional[dict]: The current image configuration if successful,
@@ -69,19 +736,145 @@ class Action:
             json.JSONDecodeError: If the response is not valid JSON
         """
         config_url = f"{self.valves.api_base_url}/api/v1/images/image/config"
+        cache = self.config_cache()
+        read_at = cache.version
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    config_url, headers=self.get_auth_headers()
-                ) as response:
-                    if response.status != 200:
-                        print(f"Error fetching current config: {await response.text()}")
-                        return None
-                    return await response.json()
+            async with http_request(
+                "GET",
+                config_url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="config",
+            ) as response:
+                if response.status != 200:
+                    print(f"Error fetching current config: {await response.text()}")
+                    return None
+                config = await response.json()
+            if not cache.store(config, read_at):
+                return dict(cache.config)  # An update landed meanwhile; it is newer.
+            return config
         except Exception as e:
             print(f"Exception in get_current_config: {e}")
             return None
 
+    async def get_model_catalog(self) -> Optional[ModelCatalog]:
+        """
+        Returns the image models of the configured server, fetching them when the cache has expired.
+
+        Returns:
+            Optional[ModelCatalog]: The catalog, a stale one if the refresh fails,
+                                    or None if the models were never fetched
+        """
+        cached = _MODEL_CATALOG.get(self.valves.api_base_url)
+        if cached and not cached.expired(self.valves.model_catalog_ttl):
+            return cached
+        fetch = _MODEL_CATALOG_FETCHES.get(self.valves.api_base_url)
+        if fetch is None or fetch.done() or fetch.get_loop() is not asyncio.get_running_loop():
+            fetch = asyncio.ensure_future(self.fetch_model_catalog(cached))
+            _MODEL_CATALOG_FETCHES[self.valves.api_base_url] = fetch
+        # Shielded, so a caller that stops waiting does not cancel it for the others.
+        return await asyncio.shield(fetch)
+
+    async def fetch_model_catalog(self, cached: Optional[ModelCatalog]) -> Optional[ModelCatalog]:
+        """Fetches the image models of the configured server into the cache, returning `cached` on failure."""
+        models_url = f"{self.valves.api_base_url}/api/v1/images/models"
+        try:
+            async with http_request(
+                "GET",
+                models_url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="models",
+            ) as response:
+                if response.status != 200:
+                    print(f"Error fetching image models: {await response.text()}")
+                    return cached
+                models = await response.json()
+        except Exception as e:
+            print(f"Exception in get_model_catalog: {e}")
+            return cached
+        catalog = ModelCatalog(models if isinstance(models, list) else [])
+        _MODEL_CATALOG[self.valves.api_base_url] = catalog
+        return catalog
+
+    def compile_presets(self, spec: str, owner: str = "", catalog: Optional[ModelCatalog] = None) -> CompiledPresets:
+        """
+        Compiles preset definitions into update payloads, once per valve text and catalog.
+
+        Model names are completed against `catalog` like `md:` input; a preset
+        naming an unknown model is rejected instead of failing when applied.
+
+        Args:
+            spec (str): Presets as `name=commands`, separated by semicolons
+            owner (str): "" for the shared valve, otherwise the user id
+            catalog (Optional[ModelCatalog]): Models to check against; without it models are not checked
+
+        Returns:
+            CompiledPresets: Preset name (lowercase) to the config fields it sets,
+                             ready to post, and the rejected presets with the reason
+        """
+        compiled = _PRESETS.get(owner)
+        if compiled is not None and compiled.spec == spec and compiled.catalog is catalog:
+            _PRESETS.move_to_end(owner)
+            return compiled
+        compiled = CompiledPresets(spec, catalog)
+        for entry in spec.split(";"):
+            name, _, commands = entry.partition("=")
+            name = name.strip().lower()
+            if not name:
+                continue
+            try:
+                updates = self.parse_input(commands)
+                if "toggle_dimensions" in updates or "preset" in updates or not updates:
+                    raise ValueError("presets need md:, st: or dm:WxH values")
+                if "model" in updates and catalog and catalog.ids:
+                    updates["model"] = catalog.resolve(updates["model"])
+            except ValueError as e:
+                compiled.rejected[name] = str(e)
+                continue
+            data: Dict[str, Any] = {}
+            if "model" in updates:
+                data["MODEL"] = updates["model"]
+            if "width" in updates:
+                data["IMAGE_SIZE"] = f"{updates['width']}x{updates['height']}"
+            if "steps" in updates:
+                data["IMAGE_STEPS"] = updates["steps"]
+            compiled.presets[name] = data
+        _PRESETS[owner] = compiled
+        _PRESETS.move_to_end(owner)
+        while len(_PRESETS) > PRESET_CACHE_SIZE:
+            _PRESETS.popitem(last=False)
+        return compiled
+
+    def get_presets(
+        self, user: Optional[dict] = None, catalog: Optional[ModelCatalog] = None
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """
+        Returns the shared presets merged with the user's own, and the rejected ones.
+
+        Args:
+            user (Optional[dict]): The `__user__` of the invocation, for its id and valves
+            catalog (Optional[ModelCatalog]): Models to check preset models against
+
+        Returns:
+            Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]: Usable presets, and
+                rejected preset names with the reason
+        """
+        shared = self.compile_presets(self.valves.presets, "", catalog)
+        presets, rejected = dict(shared.presets), dict(shared.rejected)
+        user_valves = (user or {}).get("valves")
+        if user_valves is not None and getattr(user_valves, "presets", ""):
+            own = self.compile_presets(user_valves.presets, f"user:{(user or {}).get('id', '')}", catalog)
+            for name in own.presets:
+                rejected.pop(name, None)
+            for name in own.rejected:
+                presets.pop(name, None)
+            presets.update(own.presets)
+            rejected.update(own.rejected)
+        return presets, rejected
+
     def parse_input(self, input_str: str) -> Dict[str, Any]:
         """
         Parses the user input string into configuration updates.
@@ -97,80 +890,20 @@ class Action:
                               "steps": int,
                               "width": int,
                               "height": int,
-                              "model": str
+                              "model": str,
+                              "preset": str
                           }
 
         Raises:
             ValueError: If input format is invalid or required values are missing
         """
-        updates = {}
-
-        # Split input into parts, preserving quoted strings
-        parts = []
-        current = ""
-        in_quotes = False
-
-        for char in input_str:
-            if char == '"':
-                in_quotes = not in_quotes
-            elif char == " " and not in_quotes:
-                if current:
-                    parts.append(current)
-                    current = ""
-            else:
-                current += char
-        if current:
-            parts.append(current)
-
-        # Parse each part
-        for part in parts:
-            if not part:
-                continue
-
-            # Convert to lowercase for case-insensitive matching, but preserve original for model name
-            cmd = part.lower()
-            if cmd.startswith("st:"):
-                try:
-                    steps = int(part[3:])
-                    if steps <= 0:
-                        raise ValueError(f"Invalid steps value: {steps}")
-                    updates["steps"] = steps
-                except ValueError as e:
-                    raise ValueError(f"Invalid steps format: {part}")
-
-            elif cmd.startswith("dm:"):
-                if part[3:].lower() == "tg":
-                    updates["toggle_dimensions"] = True
-                else:
-                    try:
-                        dims = part[3:].split("x")
-                        if len(dims) != 2:
-                            raise ValueError(f"Invalid dimensions format: {part}")
-                        width = int(dims[0])
-                        height = int(dims[1])
-                        if width <= 0 or height <= 0:
-                            raise ValueError(f"Invalid dimensions: {width}x{height}")
-                        updates["width"] = width
-                        updates["height"] = height
-                    except ValueError as e:
-                        raise ValueError(f"Invalid dimensions format: {part}")
-
-            elif cmd.startswith("md:"):
-                model = part[3:]
-                if not model.startswith('"') or not model.endswith('"'):
-                    raise ValueError(f"Model name must be in quotes: {part}")
-                updates["model"] = model[1:-1]  # Remove quotes
-
-            else:
-                raise ValueError(f"Unknown command: {part}")
+        return parse_commands(input_str, COMMANDS)
 
-        return updates
-
-    async def update_config(
-        self, updates: Dict[str, Any], current_config: Dict[str, Any]
-    ) -> bool:
+    def apply_updates(
+        self, updates: Dict[str, Any], current_config: Dict[str, Any], preset: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
-        Updates the image configuration with new values.
+        Builds the full image configuration that results from applying updates.
 
         Args:
             updates (Dict[str, Any]): Dictionary of values to update:
@@ -182,44 +915,98 @@ class Action:
                                         "toggle_dimensions": bool
                                     }
             current_config (Dict[str, Any]): Current configuration to preserve values
+            preset (Optional[Dict[str, Any]]): Compiled preset fields, applied before the updates
+
+        Returns:
+            Dict[str, Any]: The MODEL, IMAGE_SIZE and IMAGE_STEPS to post
+        """
+        current_config = {**current_config, **(preset or {})}
+
+        # Handle dimension toggle
+        if updates.get("toggle_dimensions"):
+            current_size = current_config.get("IMAGE_SIZE", "512x512").split("x")
+            width, height = current_size[1], current_size[0]  # Swap dimensions
+        else:
+            width = updates.get("width", current_config.get("IMAGE_SIZE", "512x512").split("x")[0])
+            height = updates.get("height", current_config.get("IMAGE_SIZE", "512x512").split("x")[1])
+
+        # Always include all required fields, using current values for any not being updated
+        return {
+            "MODEL": updates.get("model", current_config.get("MODEL", "")),
+            "IMAGE_SIZE": f"{width}x{height}",
+            "IMAGE_STEPS": updates.get(
+                "steps", current_config.get("IMAGE_STEPS", 20)
+            ),
+        }
+
+    async def post_config(self, update_data: Dict[str, Any]) -> bool:
+        """
+        Posts a full image configuration and caches what the server saved.
+
+        Args:
+            update_data (Dict[str, Any]): MODEL, IMAGE_SIZE and IMAGE_STEPS
 
         Returns:
             bool: True if update was successful, False otherwise
         """
         try:
             config_url = f"{self.valves.api_base_url}/api/v1/images/image/config/update"
+            async with http_request(
+                "POST",
+                config_url,
+                json=update_data,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                span="config update",
+            ) as response:
+                if response.status != 200:
+                    print(f"Error updating config: {await response.text()}")
+                    return False
+                try:
+                    saved = await response.json()
+                except Exception:  # Not every server echoes the saved config.
+                    saved = None
 
-            # Handle dimension toggle
-            if updates.get("toggle_dimensions"):
-                current_size = current_config.get("IMAGE_SIZE", "512x512").split("x")
-                width, height = current_size[1], current_size[0]  # Swap dimensions
-            else:
-                width = updates.get("width", current_config.get("IMAGE_SIZE", "512x512").split("x")[0])
-                height = updates.get("height", current_config.get("IMAGE_SIZE", "512x512").split("x")[1])
-
-            # Always include all required fields, using current values for any not being updated
-            update_data = {
-                "MODEL": updates.get("model", current_config.get("MODEL", "")),
-                "IMAGE_SIZE": f"{width}x{height}",
-                "IMAGE_STEPS": updates.get(
-                    "steps", current_config.get("IMAGE_STEPS", 20)
-                ),
-            }
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    config_url, json=update_data, headers=self.get_auth_headers()
-                ) as response:
-                    if response.status != 200:
-                        print(f"Error updating config: {await response.text()}")
-                        return False
-
-                return True
+            self.config_cache().store(saved if isinstance(saved, dict) and "MODEL" in saved else update_data)
+            return True
 
         except Exception as e:
-            print(f"Exception in update_config: {e}")
+            print(f"Exception in post_config: {e}")
             return False
 
+    async def update_config(
+        self,
+        updates: Dict[str, Any],
+        current_config: Dict[str, Any],
+        preset: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Updates the image configuration with new values.
+
+        The change goes through the server's ConfigWriter, which re-reads the
+        configuration and applies it there, batched with concurrent updates.
+
+        Args:
+            updates (Dict[str, Any]): Values to update, as returned by parse_input
+            current_config (Dict[str, Any]): Configuration shown to the user, used if the re-read fails
+            preset (Optional[Dict[str, Any]]): Compiled preset fields, applied before the updates
+
+        Returns:
+            Optional[Dict[str, Any]]: The configuration written, None if the update failed
+        """
+        preset = preset or {}
+        # A preset that sets every field, with no toggle on top, does not depend on the server's values.
+        blind = all(field in preset for field in IMAGE_CONFIG_FIELDS) and not updates.get("toggle_dimensions")
+        writer = _WRITERS.setdefault(self.valves.api_base_url, ConfigWriter())
+        return await writer.submit(
+            functools.partial(self.apply_updates, updates, preset=preset),
+            current_config,
+            self.get_current_config,
+            lambda update_data, _: self.post_config(update_data),  # The endpoint takes every field.
+            blind=blind,
+        )
+
+    @traced
     async def action(
         self,
         body: dict,
@@ -231,8 +1018,8 @@ class Action:
         Main entry point for the quick image config action.
 
         This method handles:
-        1. Fetching current configuration
-        2. Showing current values in modal
+        1. Reading the cached configuration (fetching it on first use)
+        2. Showing current values in modal while the cache is refreshed
         3. Getting user input
         4. Parsing and validating input
         5. Updating configuration
@@ -249,8 +1036,17 @@ class Action:
         """
         print(f"action:{__name__}")
 
-        # Get current configuration
-        current_config = await self.get_current_config()
+        # Render from the cached configuration and refresh it while the modal is
+        # open, so changes made elsewhere show up on the next run. Only the first
+        # run has to wait for the GET. The update re-reads the server before it writes.
+        # The model list is fetched alongside; it returns at once while fresh.
+        catalog_task = asyncio.ensure_future(self.get_model_catalog())
+        cache = self.config_cache()
+        if cache.config:
+            current_config = dict(cache.config)
+            cache.refresh(self.get_current_config)
+        else:
+            current_config = await self.get_current_config()
         if not current_config:
             if __event_emitter__:
                 await __event_emitter__(
@@ -285,12 +1081,20 @@ class Action:
         current_info = (
             f"Use Single or space separated updates."
         )
+        catalog = catalog_task.result() if catalog_task.done() else _MODEL_CATALOG.get(self.valves.api_base_url)
+        models_info = f"\nModels: {catalog.summary()}" if catalog and catalog.ids else ""
+        presets, rejected = self.get_presets(__user__, catalog)
+        presets_info = f"\nPresets: {', '.join(f'p:{name}' for name in presets)}" if presets else ""
 
         if __event_emitter__:
+            skipped = "; ".join(f"{name}: {reason}" for name, reason in rejected.items())
             await __event_emitter__(
                 {
                     "type": "status",
-                    "data": {"description": "Updating configuration", "done": False},
+                    "data": {
+                        "description": f"Skipped presets ({skipped})" if skipped else "Updating configuration",
+                        "done": False,
+                    },
                 }
             )
 
@@ -300,7 +1104,7 @@ class Action:
                 "data": {
                     "title": "Quick Image Config",
                     "message": current_info,
-                    "placeholder": f"Current Values:\nmd:\"{current_values['model']}\" st:{current_values['steps']} dm:{current_values['width']}x{current_values['height']}\nUse `dm:tg` to toggle portrait/landscape.",
+                    "placeholder": f"Current Values:\nmd:\"{current_values['model']}\" st:{current_values['steps']} dm:{current_values['width']}x{current_values['height']}\nUse `dm:tg` to toggle portrait/landscape.{models_info}{presets_info}",
                     "value": "",
                     "type": "text",
                     "clearable": True,
@@ -331,22 +1135,40 @@ class Action:
                 return None
                 
             # Parse user input
-            updates = self.parse_input(response)
+            with trace_span("parse"):
+                updates = self.parse_input(response)
+
+            # Complete partial model names against the server's models.
+            if "model" in updates:
+                catalog = await catalog_task or catalog
+                if catalog and catalog.ids:
+                    updates["model"] = catalog.resolve(updates["model"])
+
+            # Resolve the preset; one that sets every field is posted as compiled.
+            preset: Dict[str, Any] = {}
+            if "preset" in updates:
+                presets, rejected = self.get_presets(__user__, await catalog_task or catalog)
+                if updates["preset"] in rejected:
+                    raise ValueError(f"Preset '{updates['preset']}' was skipped: {rejected[updates['preset']]}")
+                if updates["preset"] not in presets:
+                    available = ", ".join(sorted(presets)) or "none configured"
+                    raise ValueError(f"Unknown preset '{updates['preset']}' (available: {available})")
+                preset = presets[updates["preset"]]
 
             # Update configuration
-            success = await self.update_config(updates, current_config)
+            written = await self.update_config(updates, current_config, preset)
 
-            if success:
+            if written:
                 # Prepare feedback message
                 changes = []
+                if "preset" in updates:
+                    changes.append(f"preset: {updates['preset']}")
                 if "steps" in updates:
                     changes.append(f"steps: {updates['steps']}")
                 if "model" in updates:
                     changes.append(f"model: {updates['model']}")
                 if "toggle_dimensions" in updates:
-                    current_size = current_config.get("IMAGE_SIZE", "512x512").split("x")
-                    new_width, new_height = current_size[1], current_size[0]
-                    changes.append(f"dimensions: {new_width}x{new_height}")
+                    changes.append(f"dimensions: {written['IMAGE_SIZE']}")
                 elif "width" in updates and "height" in updates:
                     changes.append(f"dimensions: {updates['width']}x{updates['height']}")
 
@@ -404,5 +1226,7 @@ class Action:
 
 # Example usage
 if __name__ == "__main__":
+    import asyncio
+
     action_instance = Action()
     asyncio.run(action_instance.action({}))
@@ -9,9 +9,622 @@ icon_url: data:image/svg+xml,%3C%3Fxml%20version%3D%221.0%22%20encoding%3D%22utf
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-import aiohttp
+from typing import Optional, Dict, Any, Callable, Iterator, List, Tuple
 import asyncio
+import bisect
+import contextlib
+import contextvars
+import difflib
+import functools
+import json
+import random
+import re
+import sys
+import time
+import types
+from urllib.parse import urlsplit
+
+_debug_log = print  # Sink for debug output such as trace spans.
+
+
+# Shared HTTP connection pool.
+# The pool, retry and tracing code down to `traced` is the same in every action,
+# byte for byte (bench/shared_code.py checks this).
+# Open WebUI loads every function as its own module, so the pool registry is kept
+# on a private entry in sys.modules where all of the actions can find it. There is
+# one ClientSession per event loop, which keeps connections to the Open WebUI API
+# and ComfyUI warm between clicks instead of handshaking on every request. The
+# session is closed when its loop shuts down its async generators, which
+# asyncio.run (and so uvicorn) does before closing the loop.
+_HTTP_POOL_MODULE = "_owui_actions_http_pool"
+HTTP_POOL_LIMIT: int = 100  # Connections across all hosts.
+HTTP_POOL_LIMIT_PER_HOST: int = 10
+HTTP_POOL_DNS_TTL: int = 300  # Seconds to cache DNS lookups.
+HTTP_POOL_KEEPALIVE: float = 60.0  # Seconds an idle connection is kept open.
+
+
+def _http_pool() -> types.ModuleType:
+    """Returns the process-wide pool registry, creating it on first use."""
+    pool = sys.modules.get(_HTTP_POOL_MODULE)
+    if pool is None:
+        pool = types.ModuleType(_HTTP_POOL_MODULE)
+        pool.sessions = {}
+        pool.closers = {}
+        sys.modules[_HTTP_POOL_MODULE] = pool
+    return pool
+
+
+def get_http_session():
+    """
+    Returns the pooled aiohttp ClientSession for the running event loop.
+
+    Sessions are created lazily, and replaced if the previous one was closed or
+    belonged to a loop that has since been closed. Callers must not close it.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    pool = _http_pool()
+    sessions: Dict[Any, Any] = pool.sessions
+    closers: Dict[Any, Any] = pool.__dict__.setdefault("closers", {})
+    for stale in [l for l in sessions if l.is_closed()]:
+        del sessions[stale]
+        closers.pop(stale, None)
+
+    session = sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_POOL_DNS_TTL,
+            keepalive_timeout=HTTP_POOL_KEEPALIVE,
+        )
+        # No cookie jar: the session is shared by actions with different tokens.
+        session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.DummyCookieJar()
+        )
+        sessions[loop] = session
+        # Held here because the loop only keeps a weak reference to it.
+        closers[loop] = _close_at_loop_shutdown(session)
+    return session
+
+
+async def close_http_session() -> None:
+    """Closes the pooled session for the running event loop, if there is one."""
+    session = _http_pool().sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _close_at_loop_shutdown(session: Any) -> Any:
+    """
+    Returns an async generator, parked at its yield, that closes `session`.
+
+    Starting it registers it with the running loop, whose shutdown_asyncgens()
+    then closes it while the loop can still await the session's close().
+    """
+
+    async def closer():
+        try:
+            yield
+        finally:
+            if not session.closed:
+                await session.close()
+
+    generator = closer()
+    try:
+        generator.asend(None).send(None)
+    except StopIteration:
+        pass  # Reached the yield.
+    return generator
+
+
+# Retries and circuit breaking for outbound requests.
+# Circuit state is kept per host on the shared pool registry, so once ComfyUI or
+# the Open WebUI API keeps failing, every action fails fast for a cool-down
+# instead of waiting out its timeout on each request.
+HTTP_RETRY_BASE_DELAY: float = 0.2  # Seconds, doubled per attempt, full jitter.
+HTTP_RETRY_MAX_DELAY: float = 2.0
+HTTP_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open a circuit.
+CIRCUIT_COOLDOWN: float = 30.0  # Seconds an open circuit fails fast.
+
+
+def _circuit(url: str) -> Dict[str, float]:
+    """Returns the circuit state of the host `url` points at."""
+    circuits = _http_pool().__dict__.setdefault("circuits", {})
+    return circuits.setdefault(urlsplit(url).netloc, {"failures": 0, "open_until": 0.0})
+
+
+def _record_outcome(circuit: Dict[str, float], ok: bool) -> None:
+    """Closes the circuit on success, opens it after too many failures in a row."""
+    if ok:
+        circuit["failures"] = 0
+        return
+    circuit["failures"] += 1
+    if circuit["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+        # Half-open after the cool-down: the next failure reopens it right away.
+        circuit["open_until"] = time.monotonic() + CIRCUIT_COOLDOWN
+
+
+@contextlib.asynccontextmanager
+async def http_request(
+    method: str, url: str, *, timeout: Any, retries: int = 0, span: Optional[str] = None, **kwargs: Any
+):
+    """
+    Sends a request on the pooled session and yields the response.
+
+    Connection errors, timeouts and 429/502/503/504 responses are retried up to
+    `retries` times with jittered exponential backoff (only pass retries for
+    idempotent requests). All attempts share the `timeout` budget, so a call
+    never takes longer than `timeout.total`. Requests to a host whose circuit
+    is open fail immediately with `aiohttp.ClientConnectionError`. The call is
+    recorded as a span named `span` when a trace is active.
+    """
+    import aiohttp
+
+    circuit = _circuit(url)
+    deadline = time.monotonic() + timeout.total if timeout.total else None
+    attempt = 0
+    started = time.perf_counter()
+    attempts = 0
+    response = None
+    status: Any = None
+    try:
+        while True:
+            if circuit["open_until"] > time.monotonic():
+                raise aiohttp.ClientConnectionError(f"Circuit open for {urlsplit(url).netloc}")
+            remaining = deadline - time.monotonic() if deadline else None
+            attempt_timeout = aiohttp.ClientTimeout(total=remaining, sock_connect=timeout.sock_connect)
+            attempts += 1
+            error: Optional[BaseException] = None
+            response = None
+            try:
+                response = await get_http_session().request(method, url, timeout=attempt_timeout, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if response is not None and response.status not in HTTP_RETRY_STATUSES:
+                _record_outcome(circuit, response.status < 500)
+                break
+            _record_outcome(circuit, False)
+
+            attempt += 1
+            delay = random.uniform(0, min(HTTP_RETRY_MAX_DELAY, HTTP_RETRY_BASE_DELAY * 2**attempt))
+            if attempt > retries or (deadline and time.monotonic() + delay >= deadline):
+                if response is None:
+                    raise error
+                break  # Out of attempts, hand back the last response.
+            if response is not None:
+                response.release()
+            await asyncio.sleep(delay)
+
+        status = response.status
+        yield response
+    except BaseException as e:
+        status = status or type(e).__name__
+        raise
+    finally:
+        if response is not None:
+            response.release()
+        _trace(
+            span or f"{method} {urlsplit(url).path}",
+            started,
+            status,
+            response.content_length if response is not None else None,
+            attempts,
+        )
+
+
+# Per-invocation tracing.
+# With `enable_debug` on, the action runs with a Tracer in `_TRACE`. Every
+# outbound request and parse step records a span into it, and the action emits
+# a one-line summary of them when it finishes. Background tasks clear it.
+_TRACE: "contextvars.ContextVar[Optional[Tracer]]" = contextvars.ContextVar("owui_action_trace", default=None)
+
+
+class Tracer:
+    """Spans (name, duration, status, bytes) recorded during one action invocation."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def record(
+        self, name: str, duration: float, status: Any = None, size: Optional[int] = None, attempts: int = 1
+    ) -> None:
+        self.spans.append(
+            {"name": name, "ms": round(duration * 1000, 1), "status": status, "bytes": size, "attempts": attempts}
+        )
+
+    def summary(self) -> str:
+        """Spans grouped by name, e.g. "kb list 42ms · file 118ms · config 2×31ms · total 210ms"."""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for span in self.spans:
+            groups.setdefault(span["name"], []).append(span)
+        parts = []
+        for name, spans in groups.items():
+            average = sum(span["ms"] for span in spans) / len(spans)
+            count = f"{len(spans)}×" if len(spans) > 1 else ""
+            failed = [str(span["status"]) for span in spans if span["status"] not in ("ok", 200, 304)]
+            parts.append(f"{name} {count}{average:.0f}ms" + (f" [{', '.join(failed)}]" if failed else ""))
+        parts.append(f"total {(time.perf_counter() - self.started) * 1000:.0f}ms")
+        return " · ".join(parts)
+
+
+def _trace(name: str, started: float, status: Any = None, size: Optional[int] = None, attempts: int = 1) -> None:
+    """Records a span that began at `started` (perf_counter) if a trace is active."""
+    tracer = _TRACE.get()
+    if tracer is not None:
+        tracer.record(name, time.perf_counter() - started, status, size, attempts)
+
+
+@contextlib.contextmanager
+def trace_span(name: str) -> Iterator[None]:
+    """Times the enclosed block as a span."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _trace(name, started, status)
+
+
+def traced(action: Callable) -> Callable:
+    """Wraps `Action.action` so debug runs are traced and end with a timing summary."""
+
+    @functools.wraps(action)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+        if not self.valves.enable_debug:
+            return await action(self, *args, **kwargs)
+        tracer = Tracer()
+        token = _TRACE.set(tracer)
+        try:
+            return await action(self, *args, **kwargs)
+        finally:
+            _TRACE.reset(token)
+            _debug_log(json.dumps({"action": __name__, "spans": tracer.spans}))
+            emitter = kwargs.get("__event_emitter__")
+            if emitter:
+                await emitter({"type": "status", "data": {"description": f"⏱ {tracer.summary()}", "done": True}})
+
+    return wrapper
+
+
+# Coalesced read-modify-write updates.
+# Every update of a target (the image config, or one user's settings) goes
+# through its ConfigWriter. Only one batch per target is in flight at a time,
+# and changes submitted while a batch waits are merged into it, so a burst from
+# several tabs or admins becomes a single POST. A batch re-reads the target
+# under the lock and applies its changes to what the server holds at that
+# moment, not to what each caller saw when its modal opened. The endpoints
+# have no version or ETag to swap against, so this re-read is the compare step.
+UPDATE_COALESCE_WINDOW: float = 0.02  # Seconds a batch waits for more changes.
+
+Change = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class ConfigWriter:
+    """Serializes and batches the read-modify-write updates of one target."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending: List[Tuple[Change, bool, "asyncio.Future[Optional[Dict[str, Any]]]"]] = []
+
+    async def submit(
+        self,
+        change: Change,
+        expected: Dict[str, Any],
+        read: Callable[[], Any],
+        write: Callable[[Dict[str, Any], Dict[str, Any]], Any],
+        blind: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Applies a change to the target, together with any changes submitted meanwhile.
+
+        Args:
+            change (Change): Returns the updated document for a given one, without mutating it
+            expected (Dict[str, Any]): The document the caller last saw, used if the re-read fails
+            read (Callable): Coroutine function fetching the current document, None on failure
+            write (Callable): Coroutine function posting a document, given the one it was
+                              derived from so it can send only what changed; True on success
+            blind (bool): The change overwrites everything it depends on, so needs no re-read
+
+        Returns:
+            Optional[Dict[str, Any]]: The document that was written, None if the write failed
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((change, blind, future))
+        async with self.lock:
+            if future.done():
+                return future.result()  # An earlier batch took this change.
+            await asyncio.sleep(UPDATE_COALESCE_WINDOW)
+            batch, self.pending = self.pending, []
+            try:
+                result = await self._apply(batch, expected, read, write)
+            except BaseException:
+                # Hand the other callers' changes to the next batch.
+                self.pending[:0] = [entry for entry in batch if entry[2] is not future]
+                raise
+            for _, _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_result(result)
+        return future.result()
+
+    async def _apply(
+        self,
+        batch: List[Tuple[Change, bool, "asyncio.Future[Optional[Dict[str, Any]]]"]],
+        expected: Dict[str, Any],
+        read: Callable[[], Any],
+        write: Callable[[Dict[str, Any], Dict[str, Any]], Any],
+    ) -> Optional[Dict[str, Any]]:
+        """Re-reads the target unless every change is blind, applies the batch in order and posts it once."""
+        blind = all(entry[1] for entry in batch)
+        current = expected if blind else (await read() or expected)
+        document = current
+        for change, _, _ in batch:
+            document = change(document)
+        if document == current and not blind:
+            return document  # Already what the server holds.
+        return document if await write(document, current) else None
+
+
+_WRITERS: Dict[str, ConfigWriter] = {}
+
+
+# Command grammar.
+# Input is a run of space separated `key:value` commands. A value may be quoted
+# to hold spaces, with backslash escapes for quotes and backslashes inside.
+# Each action maps its keys to validators in a COMMANDS table; a validator
+# checks one value and writes the updates it stands for, or raises ValueError.
+# Tokens are plain `(text, key, value, quoted)` tuples, `text` being the
+# command as typed and `key` None for a token without a colon.
+_QUOTED_TOKEN_RE = re.compile(r'([^\s:"]*):"((?:[^"\\]|\\.)*)"(?!\S)|(\S+)')
+_ESCAPE_RE = re.compile(r"\\(.)")
+
+Token = Tuple[str, Optional[str], str, bool]
+Validator = Callable[[str, str, bool, Dict[str, Any]], None]
+
+
+@functools.lru_cache(maxsize=256)
+def tokenize(input_str: str) -> Tuple[Token, ...]:
+    """Splits input into commands with the precompiled scanner, unquoting quoted values."""
+    tokens: List[Token] = []
+    for match in _QUOTED_TOKEN_RE.finditer(input_str):
+        key, value, bare = match.groups()
+        if bare is not None:
+            key, colon, value = bare.partition(":")
+            tokens.append((bare, key.lower() if colon else None, value, False))
+        else:
+            if "\\" in value:
+                value = _ESCAPE_RE.sub(r"\1", value)
+            tokens.append((match.group(0), key.lower(), value, True))
+    return tuple(tokens)
+
+
+def parse_commands(input_str: str, commands: Dict[str, Validator]) -> Dict[str, Any]:
+    """
+    Parses every command in the input against a COMMANDS table.
+
+    Args:
+        input_str (str): User input, e.g. 'st:16 md:"SDXL 1.0"'
+        commands (Dict[str, Validator]): Lowercase key to validator
+
+    Returns:
+        Dict[str, Any]: The merged updates; a later command wins over an earlier one
+
+    Raises:
+        ValueError: If a command is unknown or its value is invalid
+    """
+    updates: Dict[str, Any] = {}
+    if '"' not in input_str:
+        # Nothing is quoted, so str.split tokenizes it without the scanner.
+        for text in input_str.split():
+            key, colon, value = text.partition(":")
+            validator = commands.get(key.lower()) if colon else None
+            if validator is None:
+                raise ValueError(f"Unknown command: {text}")
+            validator(text, value, False, updates)
+        return updates
+    for text, key, value, quoted in tokenize(input_str):
+        validator = commands.get(key)
+        if validator is None:
+            raise ValueError(f"Unknown command: {text}")
+        validator(text, value, quoted, updates)
+    return updates
+
+
+def number(field: str, label: str, minimum: float, maximum: float) -> Validator:
+    """Validates a number between `minimum` and `maximum`."""
+
+    def validate(text: str, value: str, quoted: bool, updates: Dict[str, Any]) -> None:
+        try:
+            parsed = float(value)
+        except ValueError:
+            parsed = None
+        if parsed is None or not minimum <= parsed <= maximum:
+            raise ValueError(f"Invalid {label}: {text}")
+        updates[field] = parsed
+
+    return validate
+
+
+def string(field: str, label: str, quoted: bool = False, lower: bool = False, required: bool = True) -> Validator:
+    """Validates a string value, quoted if `quoted` (optional otherwise) and non-empty if `required`."""
+    must_quote = quoted
+
+    def validate(text: str, value: str, quoted: bool, updates: Dict[str, Any]) -> None:
+        if must_quote and not quoted:
+            raise ValueError(f"{label} must be in quotes: {text}")
+        if required and not value and not quoted:
+            raise ValueError(f"Missing {label}: {text}")
+        updates[field] = value.lower() if lower else value
+
+    return validate
+
+
+def toggle(field: str, label: str) -> Validator:
+    """Validates the `tg` keyword."""
+
+    def validate(text: str, value: str, quoted: bool, updates: Dict[str, Any]) -> None:
+        if value.lower() != "tg":
+            raise ValueError(f"Invalid {label}: {text}")
+        updates[field] = True
+
+    return validate
+
+
+COMMANDS: Dict[str, Validator] = {
+    "vc": string("voice", "voice", required=False),
+    "sp": number("playback_rate", "speed format", 0.5, 2.0),
+    "ap": toggle("toggle_autoplay", "autoplay command"),
+}
+
+
+# TTS voices offered by each server, for completing and checking `vc:` values.
+VOICE_PLACEHOLDER_LIMIT: int = 8  # Voice names listed in the modal placeholder.
+# One part of a mix such as `bm_lewis(2)+am_adam(1)`: a voice and an optional weight.
+_VOICE_PART_RE = re.compile(r"\s*([^()+]+?)\s*(?:\(\s*([^()]*?)\s*\))?\s*")
+
+
+class VoiceCatalog:
+    """The TTS voices of one server, indexed by id and name for completion."""
+
+    def __init__(self, voices: List[Any]):
+        self.fetched_at = time.monotonic()
+        self.ids: List[str] = []
+        entries = set()
+        for voice in voices:
+            voice_id = str(voice.get("id", "")) if isinstance(voice, dict) else str(voice)
+            if not voice_id:
+                continue
+            self.ids.append(voice_id)
+            entries.add((voice_id.lower(), voice_id))
+            if isinstance(voice, dict) and voice.get("name"):
+                entries.add((str(voice["name"]).lower(), voice_id))
+        # Sorted lowercase keys, so every key with a given prefix is one slice.
+        self._entries: List[Tuple[str, str]] = sorted(entries)
+        self._keys: List[str] = [key for key, _ in self._entries]
+
+    def expired(self, ttl: float) -> bool:
+        """Returns True once the catalog is older than `ttl` seconds."""
+        return time.monotonic() - self.fetched_at > ttl
+
+    def resolve(self, query: str) -> str:
+        """
+        Completes a partial voice name to the one voice it identifies.
+
+        Args:
+            query (str): A full or partial voice id or name, any case
+
+        Returns:
+            str: The full voice id
+
+        Raises:
+            ValueError: If no voice, or more than one, matches the query
+        """
+        key = query.strip().lower()
+        start = bisect.bisect_left(self._keys, key)
+        found = set()
+        for entry_key, voice_id in self._entries[start:]:
+            if not entry_key.startswith(key):
+                break
+            if entry_key == key:
+                return voice_id
+            found.add(voice_id)
+        if len(found) == 1:
+            return found.pop()
+        if found:
+            raise ValueError(f"Voice '{query}' is ambiguous: {', '.join(sorted(found)[:VOICE_PLACEHOLDER_LIMIT])}")
+        close = difflib.get_close_matches(key, self._keys, n=3, cutoff=0.5)
+        suggestions = sorted({voice_id for entry_key, voice_id in self._entries if entry_key in close})
+        hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+        raise ValueError(f"Unknown voice '{query}'.{hint}")
+
+    def summary(self) -> str:
+        """Returns the voice ids for the modal placeholder, shortened if there are many."""
+        shown = ", ".join(self.ids[:VOICE_PLACEHOLDER_LIMIT])
+        more = len(self.ids) - VOICE_PLACEHOLDER_LIMIT
+        return f"{shown} (+{more} more)" if more > 0 else shown
+
+
+_VOICE_CATALOG: Dict[str, VoiceCatalog] = {}
+# The fetch in flight per server, shared by concurrent opens of the modal.
+_VOICE_CATALOG_FETCHES: Dict[str, "asyncio.Future"] = {}
+
+
+# Settings changes as a minimal patch.
+# A patch maps a path of keys to the new value. Applying it copies only the
+# dicts along those paths and shares everything else with the original, so a
+# large settings document is never deep-copied to change one TTS field.
+SettingsPatch = Dict[Tuple[str, ...], Any]
+TTS_PATH: Tuple[str, ...] = ("ui", "audio", "tts")
+
+
+def apply_patch(document: Dict[str, Any], patch: SettingsPatch) -> Dict[str, Any]:
+    """
+    Returns a copy of `document` with the patch applied, copying only the touched path.
+
+    Args:
+        document (Dict[str, Any]): The settings to start from, left untouched
+        patch (SettingsPatch): Path of keys to the new value
+
+    Returns:
+        Dict[str, Any]: The new settings; untouched subtrees are the same objects as in `document`
+    """
+    if not patch:
+        return document
+    result = dict(document)
+    copied: Dict[Tuple[str, ...], Dict[str, Any]] = {(): result}
+    for path, value in patch.items():
+        node = result
+        for depth in range(1, len(path)):
+            prefix = path[:depth]
+            if prefix not in copied:
+                child = node.get(path[depth - 1])
+                copied[prefix] = dict(child) if isinstance(child, dict) else {}
+                node[path[depth - 1]] = copied[prefix]
+            node = copied[prefix]
+        node[path[-1]] = value
+    return result
+
+
+def resolve_voice_mix(mix: str, catalog: Optional[VoiceCatalog]) -> str:
+    """
+    Checks a voice or voice mix and completes every voice name in it.
+
+    Args:
+        mix (str): A voice, or voices joined by `+` with optional weights, e.g. `bm_lewis(2)+am_adam(1)`
+        catalog (Optional[VoiceCatalog]): Voices to check against; without it only the syntax is checked
+
+    Returns:
+        str: The mix with full voice ids, e.g. `bm_lewis(2)+am_adam(1)`; an empty
+             mix (`vc:`, which resets to the default voice) is returned as is
+
+    Raises:
+        ValueError: If the mix is malformed, a weight is not positive, or a voice is unknown
+    """
+    if not mix:
+        return mix
+    parts = []
+    for part in mix.split("+"):
+        match = _VOICE_PART_RE.fullmatch(part)
+        if not match:
+            raise ValueError(f"Invalid voice: {mix}")
+        name, weight = match.groups()
+        if weight is not None:
+            try:
+                valid = float(weight) > 0
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ValueError(f"Invalid voice weight: {part.strip()}")
+        if catalog and catalog.ids:
+            name = catalog.resolve(name)
+        parts.append(name if weight is None else f"{name}({weight})")
+    return "+".join(parts)
 
 
 class Action:
@@ -27,10 +640,34 @@ class Action:
         enable_debug: bool = Field(
             default=False, description="Enable debug output messages"
         )
+        request_timeout: float = Field(
+            default=30.0,
+            description="Seconds before an API request is abandoned",
+        )
+        connect_timeout: float = Field(
+            default=10.0,
+            description="Seconds allowed to open a new connection",
+        )
+        http_retries: int = Field(
+            default=2,
+            description="Extra attempts for a failed settings read, within the same timeout",
+        )
+        voice_catalog_ttl: int = Field(
+            default=300,
+            description="Seconds the list of TTS voices is cached for checking vc: values",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
 
+    def get_timeout(self, total: Optional[float] = None):
+        """Returns the per-request timeout configured in the valves, or `total` seconds for faster endpoints."""
+        import aiohttp
+
+        return aiohttp.ClientTimeout(
+            total=total or self.valves.request_timeout, sock_connect=self.valves.connect_timeout
+        )
+
     def get_auth_headers(self):
         """
         Generates authentication headers for API requests.
@@ -47,18 +684,64 @@ class Action:
         """
         settings_url = f"{self.valves.api_base_url}/api/v1/users/user/settings"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    settings_url, headers=self.get_auth_headers()
-                ) as response:
-                    if response.status != 200:
-                        print(f"Error fetching current settings: {await response.text()}")
-                        return None
-                    return await response.json()
+            async with http_request(
+                "GET",
+                settings_url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="settings",
+            ) as response:
+                if response.status != 200:
+                    print(f"Error fetching current settings: {await response.text()}")
+                    return None
+                return await response.json()
         except Exception as e:
             print(f"Exception in get_current_settings: {e}")
             return None
 
+    async def get_voice_catalog(self) -> Optional[VoiceCatalog]:
+        """
+        Returns the TTS voices of the configured server, fetching them when the cache has expired.
+
+        Returns:
+            Optional[VoiceCatalog]: The catalog, a stale one if the refresh fails,
+                                    or None if the voices were never fetched
+        """
+        cached = _VOICE_CATALOG.get(self.valves.api_base_url)
+        if cached and not cached.expired(self.valves.voice_catalog_ttl):
+            return cached
+        fetch = _VOICE_CATALOG_FETCHES.get(self.valves.api_base_url)
+        if fetch is None or fetch.done() or fetch.get_loop() is not asyncio.get_running_loop():
+            fetch = asyncio.ensure_future(self.fetch_voice_catalog(cached))
+            _VOICE_CATALOG_FETCHES[self.valves.api_base_url] = fetch
+        # Shielded, so a caller that stops waiting does not cancel it for the others.
+        return await asyncio.shield(fetch)
+
+    async def fetch_voice_catalog(self, cached: Optional[VoiceCatalog]) -> Optional[VoiceCatalog]:
+        """Fetches the TTS voices of the configured server into the cache, returning `cached` on failure."""
+        voices_url = f"{self.valves.api_base_url}/api/v1/audio/voices"
+        try:
+            async with http_request(
+                "GET",
+                voices_url,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                retries=self.valves.http_retries,
+                span="voices",
+            ) as response:
+                if response.status != 200:
+                    print(f"Error fetching voices: {await response.text()}")
+                    return cached
+                data = await response.json()
+        except Exception as e:
+            print(f"Exception in get_voice_catalog: {e}")
+            return cached
+        voices = data.get("voices", []) if isinstance(data, dict) else data
+        catalog = VoiceCatalog(voices if isinstance(voices, list) else [])
+        _VOICE_CATALOG[self.valves.api_base_url] = catalog
+        return catalog
+
     def parse_input(self, input_str: str) -> Dict[str, Any]:
         """
         Parses the user input string into settings updates.
@@ -67,87 +750,97 @@ class Action:
         - sp:1.5
         - ap:tg
         """
-        updates = {}
-        parts = input_str.split()
+        return parse_commands(input_str, COMMANDS)
 
-        for part in parts:
-            if not part:
-                continue
+    def settings_patch(self, updates: Dict[str, Any], current_settings: Dict[str, Any]) -> SettingsPatch:
+        """
+        Lists the settings values that applying updates changes.
 
-            cmd = part.lower()
-            if cmd.startswith("vc:"):
-                voice = part[3:]
-                updates["voice"] = voice
-            elif cmd.startswith("sp:"):
-                try:
-                    speed = float(part[3:])
-                    if not 0.5 <= speed <= 2.0:
-                        raise ValueError(f"Speed must be between 0.5 and 2.0: {speed}")
-                    updates["playback_rate"] = speed
-                except ValueError as e:
-                    raise ValueError(f"Invalid speed format: {part}")
-            elif cmd.startswith("ap:"):
-                if part[3:].lower() == "tg":
-                    updates["toggle_autoplay"] = True
-                else:
-                    raise ValueError(f"Invalid autoplay command: {part}")
-            else:
-                raise ValueError(f"Unknown command: {part}")
+        Returns:
+            SettingsPatch: Path of keys to the new value, e.g. ("ui", "audio", "tts", "voice")
+        """
+        patch: SettingsPatch = {}
+        current_tts = current_settings.get("ui", {}).get("audio", {}).get("tts", {})
 
-        return updates
+        # Update only the TTS settings that need to change
+        if "voice" in updates:
+            patch[TTS_PATH + ("voice",)] = updates["voice"]
+        if "playback_rate" in updates:
+            patch[TTS_PATH + ("playbackRate",)] = updates["playback_rate"]
+        if patch:
+            # Fill in what the TTS settings need if they were never saved.
+            if "engineConfig" not in current_tts:
+                patch[TTS_PATH + ("engineConfig",)] = {"dtype": "fp16"}
+            if "defaultVoice" not in current_tts:
+                patch[TTS_PATH + ("defaultVoice",)] = "am_adam"
+
+        # Handle autoplay toggle
+        if updates.get("toggle_autoplay"):
+            current_autoplay = current_settings.get("ui", {}).get("responseAutoPlayback", False)
+            patch[("ui", "responseAutoPlayback")] = not current_autoplay
+
+        return patch
+
+    def apply_updates(self, updates: Dict[str, Any], current_settings: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Builds the settings document that results from applying updates, leaving `current_settings` untouched.
+        """
+        return apply_patch(current_settings, self.settings_patch(updates, current_settings))
 
-    async def update_settings(
-        self, updates: Dict[str, Any], current_settings: Dict[str, Any]
-    ) -> bool:
+    async def post_settings(self, update_data: Dict[str, Any], current_settings: Dict[str, Any]) -> bool:
         """
-        Updates the user settings with new values while preserving all other settings.
+        Posts the top-level sections of `update_data` that differ from `current_settings`.
+
+        The server merges the posted sections into the stored settings, so the
+        rest of the document does not have to be sent. Returns True on success.
         """
         try:
             settings_url = f"{self.valves.api_base_url}/api/v1/users/user/settings/update"
-
-            # Deep copy the current settings to avoid modifying the original
-            update_data = current_settings.copy()
-
-            # Get current TTS settings
-            current_tts = current_settings.get("ui", {}).get("audio", {}).get("tts", {})
-            
-            # Update only the TTS settings that need to change
-            if "voice" in updates or "playback_rate" in updates:
-                if "ui" not in update_data:
-                    update_data["ui"] = {}
-                if "audio" not in update_data["ui"]:
-                    update_data["ui"]["audio"] = {}
-                if "tts" not in update_data["ui"]["audio"]:
-                    update_data["ui"]["audio"]["tts"] = current_tts.copy()
-
-                update_data["ui"]["audio"]["tts"].update({
-                    "voice": updates.get("voice", current_tts.get("voice", "")),
-                    "playbackRate": updates.get("playback_rate", current_tts.get("playbackRate", 1.0)),
-                    "engineConfig": current_tts.get("engineConfig", {"dtype": "fp16"}),
-                    "defaultVoice": current_tts.get("defaultVoice", "am_adam")
-                })
-
-            # Handle autoplay toggle
-            if updates.get("toggle_autoplay"):
-                if "ui" not in update_data:
-                    update_data["ui"] = {}
-                current_autoplay = current_settings.get("ui", {}).get("responseAutoPlayback", False)
-                update_data["ui"]["responseAutoPlayback"] = not current_autoplay
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    settings_url, json=update_data, headers=self.get_auth_headers()
-                ) as response:
-                    if response.status != 200:
-                        print(f"Error updating settings: {await response.text()}")
-                        return False
+            # Untouched sections are the same objects, so an identity check finds the changed ones.
+            payload = {key: value for key, value in update_data.items() if value is not current_settings.get(key)}
+            body = json.dumps(payload, separators=(",", ":"))
+            if self.valves.enable_debug:
+                full = len(json.dumps(update_data, separators=(",", ":")))
+                print(f"Settings update: {len(body)} bytes ({', '.join(payload)}) instead of {full} bytes")
+
+            async with http_request(
+                "POST",
+                settings_url,
+                data=body,
+                headers=self.get_auth_headers(),
+                timeout=self.get_timeout(),
+                span="settings update",
+            ) as response:
+                if response.status != 200:
+                    print(f"Error updating settings: {await response.text()}")
+                    return False
 
             return True
 
         except Exception as e:
-            print(f"Exception in update_settings: {e}")
+            print(f"Exception in post_settings: {e}")
             return False
 
+    async def update_settings(
+        self, updates: Dict[str, Any], current_settings: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Updates the user settings with new values while preserving all other settings.
+
+        The change goes through the user's ConfigWriter, which re-reads the
+        settings and applies it there, batched with concurrent updates.
+        Returns the settings written, or None if the update failed.
+        """
+        # Settings belong to the user behind the token.
+        writer = _WRITERS.setdefault(f"{self.valves.api_base_url}|{self.valves.auth_token}", ConfigWriter())
+        return await writer.submit(
+            functools.partial(self.apply_updates, updates),
+            current_settings,
+            self.get_current_settings,
+            self.post_settings,
+        )
+
+    @traced
     async def action(
         self,
         body: dict,
@@ -160,6 +853,9 @@ class Action:
         """
         print(f"action:{__name__}")
 
+        # The voice list is fetched alongside; it returns at once while fresh.
+        catalog_task = asyncio.ensure_future(self.get_voice_catalog())
+
         # Get current settings
         current_settings = await self.get_current_settings()
         if not current_settings:
@@ -188,6 +884,8 @@ class Action:
 
             f"Use space-separated commands to update:"
         )
+        catalog = catalog_task.result() if catalog_task.done() else _VOICE_CATALOG.get(self.valves.api_base_url)
+        voices_info = f"\nVoices: {catalog.summary()}" if catalog and catalog.ids else ""
 
         if __event_emitter__:
             await __event_emitter__(
@@ -203,7 +901,7 @@ class Action:
                 "data": {
                     "title": "Quick Voice Config",
                     "message": current_info,
-                    "placeholder": f"Current Settings:\nvc:{current_values['voice']} sp:{current_values['playback_rate']} ap: {'On' if current_values['autoplay'] else 'Off'}\nUse `ap:tg` to toggle autoplay",
+                    "placeholder": f"Current Settings:\nvc:{current_values['voice']} sp:{current_values['playback_rate']} ap: {'On' if current_values['autoplay'] else 'Off'}\nUse `ap:tg` to toggle autoplay{voices_info}",
                     "value": "",
                     "type": "text",
                     "clearable": True,
@@ -238,12 +936,17 @@ class Action:
                 response = str(response)
                 
             # Parse user input
-            updates = self.parse_input(response)
+            with trace_span("parse"):
+                updates = self.parse_input(response)
+
+            # Check every voice of a mix against the server's voices and complete partial names.
+            if "voice" in updates:
+                updates["voice"] = resolve_voice_mix(updates["voice"], await catalog_task or catalog)
 
             # Update settings
-            success = await self.update_settings(updates, current_settings)
+            written = await self.update_settings(updates, current_settings)
 
-            if success:
+            if written:
                 # Prepare feedback message
                 changes = []
                 if "voice" in updates:
@@ -251,7 +954,7 @@ class Action:
                 if "playback_rate" in updates:
                     changes.append(f"speed: {updates['playback_rate']}")
                 if "toggle_autoplay" in updates:
-                    new_autoplay = not current_values["autoplay"]
+                    new_autoplay = written.get("ui", {}).get("responseAutoPlayback", False)
                     changes.append(f"autoplay: {'On' if new_autoplay else 'Off'}")
 
                 status_msg = "Updated: " + ", ".join(changes) if changes else "No changes made"
@@ -308,5 +1011,7 @@ class Action:
 
 # Example usage
 if __name__ == "__main__":
+    import asyncio
+
     action_instance = Action()
     asyncio.run(action_instance.action({})) 
\ No newline at end of file
@@ -15,12 +15,7 @@ and calculate days until specific events.
 
 from datetime import datetime, timedelta
 from pydantic import BaseModel, Field
-import caldav
-import pytz
-from icalendar import Calendar
 from typing import Dict, List
-from dotenv import load_dotenv
-import os
 
 
 class Tools:
@@ -79,6 +74,11 @@ class Tools:
             Events are sorted by start time
             Returns "No calendars found" if no calendars are available
         """
+        # Imported on first use so loading the tool stays cheap.
+        import caldav
+        import pytz
+        from icalendar import Calendar
+
         client = caldav.DAVClient(
             url=self.valves.caldav_url,
             username=self.valves.caldav_user,
@@ -13,14 +13,9 @@ priorities, due dates, and descriptions. It's particularly useful for AI
 assistants to understand and manage task lists and track task completion.
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from pydantic import BaseModel, Field
-import caldav
-import pytz
-from icalendar import Calendar
-from typing import Dict, List, Optional
-from dotenv import load_dotenv
-import os
+from typing import Dict, List
 
 
 class Tools:
@@ -83,6 +78,11 @@ class Tools:
             Returns "No tasks found" if no calendars are available
             Completed tasks are excluded by default unless include_completed is True
         """
+        # Imported on first use so loading the tool stays cheap.
+        import caldav
+        import pytz
+        from icalendar import Calendar
+
         client = caldav.DAVClient(
             url=self.valves.caldav_url,
             username=self.valves.caldav_user,